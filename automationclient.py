@@ -0,0 +1,230 @@
+"""Client for the JSON-RPC automation server of the browser, and a smoke
+check driving a browser started offscreen against a local HTTP server:
+
+    python automationclient.py
+
+It opens a tab, loads a local page and waits for it in one batch, then
+evaluates a script in the page. It also checks that the first page load
+started within a time budget. The exit code is 1 if a check failed.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PySide6.QtCore import (QCommandLineOption, QCommandLineParser,
+                            QCoreApplication)
+from PySide6.QtNetwork import QLocalSocket
+
+_timeout = 60.0
+# PySide keeps the GIL while waiting for the socket, so waits are split
+# into slices of this many ms to let other Python threads run, like the
+# HTTP server of the smoke check
+_wait_slice = 20
+
+
+class AutomationError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+# Talks to an AutomationServer over its QLocalServer with blocking
+# calls, matching responses to requests by id.
+class AutomationClient:
+    """Calls the methods of a browser's automation server."""
+
+    def __init__(self, name):
+        self._name = name
+        self._socket = QLocalSocket()
+        self._buffer = b''
+        self._next_id = 1
+
+    def connect(self, timeout=_timeout):
+        """Connects to the server, waiting for it to start listening."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._socket.connectToServer(self._name)
+            if self._socket.waitForConnected(1000):
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Cannot connect to "{self._name}": '
+                                   f'{self._socket.errorString()}')
+            self._socket.abort()
+            time.sleep(0.2)
+
+    def close(self):
+        self._socket.disconnectFromServer()
+
+    def _request(self, method, params):
+        request = {'jsonrpc': '2.0', 'id': self._next_id, 'method': method,
+                   'params': params}
+        self._next_id += 1
+        return request
+
+    def _send(self, message):
+        self._socket.write(json.dumps(message).encode('utf-8') + b'\n')
+        self._socket.flush()
+
+    def _receive(self, timeout):
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError('No response from the automation server')
+            slice_ms = min(_wait_slice, max(1, int(remaining * 1000)))
+            if not self._socket.waitForReadyRead(slice_ms):
+                if self._socket.state() != QLocalSocket.ConnectedState:
+                    raise ConnectionError('Automation server disconnected')
+                time.sleep(0)
+            self._buffer += self._socket.readAll().data()
+        line, _, self._buffer = self._buffer.partition(b'\n')
+        return json.loads(line)
+
+    @staticmethod
+    def _result(response):
+        error = response.get('error')
+        if error is not None:
+            raise AutomationError(error['code'], error['message'])
+        return response['result']
+
+    def call(self, method, params=None, timeout=_timeout):
+        """Calls method with a dict of params and returns its result."""
+        request = self._request(method, params or {})
+        self._send(request)
+        while True:
+            response = self._receive(timeout)
+            if isinstance(response, dict) and response.get('id') == request['id']:
+                return self._result(response)
+
+    def batch(self, calls, timeout=_timeout):
+        """Sends (method, params) pairs as one batch and returns their
+        results in order. All requests are dispatched at once."""
+        requests = [self._request(method, params) for method, params in calls]
+        self._send(requests)
+        while True:
+            responses = self._receive(timeout)
+            if isinstance(responses, list):
+                break
+        by_id = {response.get('id'): response for response in responses}
+        return [self._result(by_id[request['id']]) for request in requests]
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Serves /page/<n> as a page titled "Page <n>"."""
+
+    def do_GET(self):
+        kind, _, argument = self.path.strip('/').partition('/')
+        if kind != 'page':
+            self.send_error(404)
+            return
+        body = (f'<!DOCTYPE html><html><head><title>Page {argument}</title>'
+                f'</head><body><p id="content">{argument}</p></body>'
+                f'</html>').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _startServer():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _startBrowser(server_name, url, config_dir):
+    # Keep the configuration, profile and cache of the user untouched
+    environment = dict(os.environ, XDG_CONFIG_HOME=config_dir,
+                       XDG_DATA_HOME=config_dir, XDG_CACHE_HOME=config_dir)
+    environment.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    main_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'main.py')
+    return subprocess.Popen([sys.executable, main_file, '--new-instance',
+                             '--automation-server', server_name, url],
+                            env=environment)
+
+
+def runChecks(client, base_url, startup_budget_ms):
+    """Returns a list of failure descriptions."""
+    failures = []
+
+    def check(description, condition):
+        print(f'{"ok  " if condition else "FAIL"} {description}')
+        if not condition:
+            failures.append(description)
+
+    first_load = client.call('tabs.waitForLoad')
+    check('initial page loaded', first_load['ok'])
+    trace = {p['phase']: p['elapsed_ms'] for p in client.call('startup.trace')}
+    load_started_ms = trace.get('first load started')
+    check(f'first load started after {load_started_ms} ms, budget '
+          f'{startup_budget_ms} ms', load_started_ms is not None
+          and load_started_ms <= startup_budget_ms)
+    opened, loaded, waited = client.batch([
+        ('tabs.open', {}),
+        ('tabs.load', {'url': f'{base_url}/page/2'}),
+        ('tabs.waitForLoad', {'timeout': 20000})])
+    check('tab opened', opened['index'] == 1)
+    check('page loaded', waited['ok'] and waited['url'].endswith('/page/2'))
+    script = 'document.getElementById("content").textContent'
+    content = client.call('tabs.evaluate', {'index': opened['index'],
+                                            'script': script})
+    check('script evaluated in the page', content == '2')
+    tabs = client.call('tabs.list')
+    check('tabs listed', [t['title'] for t in tabs] == ['Page 1', 'Page 2'])
+    try:
+        client.call('tabs.waitForLoad', {'timeout': 'soon'})
+        check('invalid timeout rejected', False)
+    except AutomationError as e:
+        check('invalid timeout rejected', e.code == -32602)
+    client._send({'jsonrpc': '2.0', 'id': 'invalid', 'method': 1})
+    response = client._receive(_timeout)
+    check('invalid request answered with its id',
+          response.get('id') == 'invalid'
+          and response.get('error', {}).get('code') == -32600)
+    return failures
+
+
+if __name__ == '__main__':
+    app = QCoreApplication(sys.argv)
+    parser = QCommandLineParser()
+    parser.setApplicationDescription('Broda automation smoke check')
+    parser.addHelpOption()
+    name_option = QCommandLineOption(
+        ['server-name'], 'Local socket name of the automation server '
+        '(default broda-automation-<pid>).', 'name')
+    parser.addOption(name_option)
+    budget_option = QCommandLineOption(
+        ['startup-budget'], 'Maximum time in ms from process start until '
+        'the first page load starts (default 3000).', 'ms', '3000')
+    parser.addOption(budget_option)
+    parser.process(app)
+
+    server_name = (parser.value(name_option) if parser.isSet(name_option)
+                   else f'broda-automation-{os.getpid()}')
+    server, base_url = _startServer()
+    config_dir = tempfile.TemporaryDirectory()
+    browser = _startBrowser(server_name, f'{base_url}/page/1', config_dir.name)
+    client = AutomationClient(server_name)
+    try:
+        client.connect()
+        failures = runChecks(client, base_url,
+                             float(parser.value(budget_option)))
+    finally:
+        client.close()
+        browser.terminate()
+        browser.wait(10)
+        server.shutdown()
+        config_dir.cleanup()
+    sys.exit(1 if failures else 0)
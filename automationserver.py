@@ -0,0 +1,315 @@
+import json
+
+import speculation
+import startuptrace
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice, QObject, QTimer, QUrl
+from PySide6.QtNetwork import QLocalServer
+
+_PARSE_ERROR = -32700
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INVALID_PARAMS = -32602
+_SERVER_ERROR = -32000
+
+_default_load_timeout = 30000
+_max_load_timeout = 24 * 3600 * 1000
+
+
+class _Connection(QObject):
+    """Reads newline delimited JSON-RPC 2.0 requests from a QLocalSocket.
+
+    Every complete line in the receive buffer is dispatched immediately,
+    so clients can pipeline requests without waiting for replies.
+    Responses are written as soon as each request completes and may
+    therefore arrive out of order; clients match them by id."""
+
+    def __init__(self, socket, server):
+        super().__init__(server)
+        socket.setParent(self)
+        self._socket = socket
+        self._server = server
+        self._buffer = b''
+        socket.readyRead.connect(self._readyRead)
+        socket.disconnected.connect(self._disconnected)
+
+    def _disconnected(self):
+        self._socket = None
+        self.deleteLater()
+
+    def _readyRead(self):
+        self._buffer += self._socket.readAll().data()
+        lines = self._buffer.split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._handleLine(line)
+
+    def _handleLine(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            self._write(_errorResponse(None, _PARSE_ERROR, str(e)))
+            return
+        if isinstance(message, list):
+            self._handleBatch(message)
+        else:
+            self._handleRequest(message, self._write)
+
+    # A batch is answered with a single array once all of its requests
+    # have completed, in request order.
+    def _handleBatch(self, requests):
+        if not requests:
+            self._write(_errorResponse(None, _INVALID_REQUEST, 'Empty batch'))
+            return
+        responses = [None] * len(requests)
+        remaining = [len(requests)]
+
+        def collect(position, response):
+            responses[position] = response
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                results = [r for r in responses if r is not None]
+                if results:
+                    self._write(results)
+
+        for position, request in enumerate(requests):
+            self._handleRequest(request,
+                                lambda r, p=position: collect(p, r))
+
+    def _handleRequest(self, request, respond):
+        request_id = _requestId(request)
+        if (not isinstance(request, dict) or request.get('jsonrpc') != '2.0'
+                or not isinstance(request.get('method'), str)):
+            respond(_errorResponse(request_id, _INVALID_REQUEST,
+                                   'Invalid request'))
+            return
+        is_notification = 'id' not in request
+        params = request.get('params', {})
+        responded = [False]
+
+        # Every request is answered once, even if a handler fails after
+        # it has replied
+        def done(result=None, error=None):
+            if responded[0]:
+                return
+            responded[0] = True
+            if is_notification:
+                respond(None)
+            elif error is not None:
+                respond(_errorResponse(request_id, error[0], error[1]))
+            else:
+                respond({'jsonrpc': '2.0', 'id': request_id,
+                         'result': result})
+
+        if not isinstance(params, dict):
+            done(error=(_INVALID_PARAMS, 'params must be an object'))
+            return
+        self._server.dispatch(request['method'], params, done)
+
+    def _write(self, response):
+        if response is not None and self._socket is not None:
+            data = json.dumps(response, separators=(',', ':'))
+            self._socket.write(QByteArray(data.encode('utf-8') + b'\n'))
+
+
+# The id of a request as far as it can be told, so that clients can
+# match even the error responses to invalid requests
+def _requestId(request):
+    if isinstance(request, dict):
+        request_id = request.get('id')
+        if (isinstance(request_id, (str, int, float))
+                and not isinstance(request_id, bool)):
+            return request_id
+    return None
+
+
+def _errorResponse(request_id, code, message):
+    return {'jsonrpc': '2.0', 'id': request_id,
+            'error': {'code': code, 'message': message}}
+
+
+class _RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+# An opt-in local automation endpoint exposing BrowserTabWidget
+# operations through JSON-RPC 2.0 over a QLocalServer, one JSON
+# request (or batch array) per line.
+class AutomationServer(QObject):
+    """Lets test harnesses drive the tabs of the browser windows.
+
+    Methods (all take an optional "window" index, default 0):
+    tabs.list, tabs.open(url), tabs.close(index), tabs.activate(index),
+    tabs.load(index, url), tabs.waitForLoad(index, timeout),
+    tabs.evaluate(index, script), tabs.screenshot(index, format),
+    startup.trace, speculation.statistics."""
+
+    def __init__(self, tab_widgets_function, parent=None):
+        super().__init__(parent)
+        self._tab_widgets_function = tab_widgets_function
+        self._server = QLocalServer(self)
+        self._server.newConnection.connect(self._newConnection)
+        self._methods = {
+            'tabs.list': self._listTabs,
+            'tabs.open': self._openTab,
+            'tabs.close': self._closeTab,
+            'tabs.activate': self._activateTab,
+            'tabs.load': self._load,
+            'tabs.waitForLoad': self._waitForLoad,
+            'tabs.evaluate': self._evaluate,
+            'tabs.screenshot': self._screenshot,
+            'startup.trace': self._startupTrace,
+            'speculation.statistics': self._speculationStatistics,
+        }
+
+    def listen(self, name):
+        QLocalServer.removeServer(name)
+        if not self._server.listen(name):
+            error = self._server.errorString()
+            raise RuntimeError(f'Cannot listen on "{name}": {error}')
+        print(f'Automation server listening on {self._server.fullServerName()}')
+
+    def _newConnection(self):
+        while self._server.hasPendingConnections():
+            _Connection(self._server.nextPendingConnection(), self)
+
+    def dispatch(self, method, params, done):
+        handler = self._methods.get(method)
+        if handler is None:
+            done(error=(_METHOD_NOT_FOUND, f'Unknown method "{method}"'))
+            return
+        try:
+            handler(params, done)
+        except _RpcError as e:
+            done(error=(e.code, str(e)))
+        except Exception as e:
+            done(error=(_SERVER_ERROR, f'{type(e).__name__}: {e}'))
+
+    def _tabWidget(self, params):
+        tab_widgets = self._tab_widgets_function()
+        window = params.get('window', 0)
+        if not isinstance(window, int) or not 0 <= window < len(tab_widgets):
+            raise _RpcError(_INVALID_PARAMS, f'No such window: {window}')
+        return tab_widgets[window]
+
+    def _index(self, tab_widget, params):
+        index = params.get('index', tab_widget.currentIndex())
+        if not isinstance(index, int) or not 0 <= index < tab_widget.count():
+            raise _RpcError(_INVALID_PARAMS, f'No such tab: {index}')
+        return index
+
+    # Creates the view of a restored tab that was not activated yet
+    def _view(self, params):
+        tab_widget = self._tabWidget(params)
+        return tab_widget.webEngineView(self._index(tab_widget, params))
+
+    @staticmethod
+    def _url(params):
+        url = QUrl.fromUserInput(str(params.get('url', '')))
+        if not url.isValid():
+            raise _RpcError(_INVALID_PARAMS, 'Invalid url')
+        return url
+
+    def _listTabs(self, params, done):
+        tab_widget = self._tabWidget(params)
+        current = tab_widget.currentIndex()
+        tabs = []
+        for index in range(tab_widget.count()):
+            view = tab_widget.widget(index)
+            tabs.append({'index': index, 'url': view.url().toString(),
+                         'title': view.title(),
+                         'loading': view.isLoading(),
+                         'current': index == current})
+        done(tabs)
+
+    def _openTab(self, params, done):
+        tab_widget = self._tabWidget(params)
+        view = tab_widget.addBrowserTab()
+        if 'url' in params:
+            view.setUrl(self._url(params))
+        done({'index': tab_widget.indexOf(view)})
+
+    def _closeTab(self, params, done):
+        tab_widget = self._tabWidget(params)
+        index = self._index(tab_widget, params)
+        if tab_widget.count() < 2:
+            raise _RpcError(_SERVER_ERROR, 'Cannot close the last tab')
+        tab_widget.handleTabCloseRequest(index)
+        done(True)
+
+    def _activateTab(self, params, done):
+        tab_widget = self._tabWidget(params)
+        tab_widget.setCurrentIndex(self._index(tab_widget, params))
+        done(True)
+
+    def _load(self, params, done):
+        self._view(params).setUrl(self._url(params))
+        done(True)
+
+    # Completes when the tab's current load has finished; immediately
+    # if it is not loading. Combined with tabs.load in a pipeline this
+    # waits for the requested page since setUrl() marks the view as
+    # loading synchronously. Fails if the tab is closed meanwhile.
+    def _waitForLoad(self, params, done):
+        view = self._view(params)
+        timeout = params.get('timeout', _default_load_timeout)
+        if (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                or not 0 <= timeout <= _max_load_timeout):
+            raise _RpcError(_INVALID_PARAMS,
+                            f'timeout must be 0..{_max_load_timeout} ms')
+        if not view.isLoading():
+            done({'ok': view.lastLoadSucceeded(), 'url': view.url().toString()})
+            return
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+
+        def finish(result=None, error=None, view_alive=True):
+            timer.stop()
+            timer.deleteLater()
+            if view_alive:
+                view.loadFinished.disconnect(finished)
+                view.destroyed.disconnect(destroyed)
+            done(result, error)
+
+        def finished(ok):
+            finish({'ok': ok, 'url': view.url().toString()})
+
+        def timedOut():
+            finish(error=(_SERVER_ERROR, 'Timed out waiting for load'))
+
+        def destroyed():
+            finish(error=(_SERVER_ERROR, 'Tab closed while waiting for load'),
+                   view_alive=False)
+
+        view.loadFinished.connect(finished)
+        view.destroyed.connect(destroyed)
+        timer.timeout.connect(timedOut)
+        timer.start(int(timeout))
+
+    def _evaluate(self, params, done):
+        script = params.get('script')
+        if not isinstance(script, str):
+            raise _RpcError(_INVALID_PARAMS, 'script must be a string')
+        self._view(params).page().runJavaScript(script, 0, done)
+
+    def _screenshot(self, params, done):
+        image_format = str(params.get('format', 'PNG')).upper()
+        pixmap = self._view(params).grab()
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        if not pixmap.save(buffer, image_format):
+            raise _RpcError(_INVALID_PARAMS,
+                            f'Cannot encode screenshot as {image_format}')
+        done({'format': image_format, 'width': pixmap.width(),
+              'height': pixmap.height(),
+              'data': bytes(buffer.data().toBase64()).decode('ascii')})
+
+    # Lets a harness check the startup phases against a time budget
+    def _startupTrace(self, params, done):
+        done([{'phase': name, 'elapsed_ms': round(seconds * 1000, 1)}
+              for name, seconds in startuptrace.phases()])
+
+    def _speculationStatistics(self, params, done):
+        done(speculation.statistics())
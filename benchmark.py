@@ -0,0 +1,558 @@
+"""Offscreen benchmarks of the tab, bookmark, history and download
+handling. Pages and downloads are served by a local HTTP server, wall
+time and peak RSS are reported per benchmark as JSON and can be compared
+against a stored baseline:
+
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json
+
+peak_rss_kb is the peak of the browser process alone, child_peak_rss_kb
+the sum of the peaks of its child processes (the Qt WebEngine zygote and
+renderers) that are alive at the end of the benchmark.
+
+The exit code is 1 if a benchmark regressed by more than the tolerance.
+The report records the environment it was taken in; a comparison
+against a baseline of a different machine, Qt, PySide or Python version
+or with different parameters (including the benchmarks run) is flagged
+as such, as its numbers are hardly comparable.
+"""
+
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import gc
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PySide6 import __version__ as pyside_version
+from PySide6.QtCore import (QCommandLineOption, QCommandLineParser,
+                            QCoreApplication, QEvent, QEventLoop, QStandardPaths,
+                            Qt, QUrl, qVersion)
+from PySide6.QtGui import QGuiApplication
+from PySide6.QtWidgets import QApplication, QMainWindow, QMenu
+from PySide6.QtWebEngineCore import QWebEnginePage, QWebEngineProfile
+
+import bookmarkwidget
+from bookmarkwidget import BookmarkWidget
+from browsertabwidget import BrowserTabWidget
+from downloadwidget import DownloadWidget
+from historywindow import HistoryModel, HistoryWindow
+from sessionstore import readSession
+
+_timeout = 60.0
+_download_chunk_size = 64 * 1024
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Serves /page/<n> as a small HTML page and /download/<bytes> as
+    an attachment of that size."""
+
+    def do_GET(self):
+        kind, _, argument = self.path.strip('/').partition('/')
+        if kind == 'page':
+            paragraphs = ''.join(f'<p>Paragraph {i} of page {argument}</p>'
+                                 for i in range(50))
+            body = (f'<!DOCTYPE html><html><head><title>Page {argument}</title>'
+                    f'</head><body>{paragraphs}</body></html>').encode('utf-8')
+            self._sendHeaders('text/html; charset=utf-8', len(body))
+            self.wfile.write(body)
+        elif kind == 'download' and argument.isdigit():
+            size = int(argument)
+            self._sendHeaders('application/octet-stream', size,
+                              f'attachment; filename="download-{size}.bin"')
+            chunk = b'\0' * _download_chunk_size
+            while size > 0:
+                self.wfile.write(chunk[:size])
+                size -= _download_chunk_size
+        else:
+            self.send_error(404)
+
+    def _sendHeaders(self, content_type, length, disposition=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        if disposition:
+            self.send_header('Content-Disposition', disposition)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _startServer():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _waitFor(predicate, timeout=_timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError('Benchmark timed out')
+        QCoreApplication.processEvents(QEventLoop.AllEvents, 50)
+
+
+def _processDeferredDeletes():
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    QCoreApplication.processEvents()
+
+
+# Peak RSS from /proc, where it can be reset per benchmark (Linux 4.0+).
+# Elsewhere the peak of the whole run is reported.
+def _resetPeakRss(pid='self'):
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _procPeakRssKb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peakRssKb():
+    peak = _procPeakRssKb('self')
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _childProcesses():
+    """Returns the ids of all descendant processes (Linux only)."""
+    children = {}  # map parent id to list of process ids
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name in parentheses may contain blanks
+        parent = int(stat[stat.rindex(')') + 2:].split()[1])
+        children.setdefault(parent, []).append(int(entry))
+    result = []
+    pending = [os.getpid()]
+    while pending:
+        descendants = children.get(pending.pop(), [])
+        result += descendants
+        pending += descendants
+    return result
+
+
+def _resetChildPeakRss():
+    for pid in _childProcesses():
+        _resetPeakRss(pid)
+
+
+def _childPeakRssKb():
+    if not sys.platform.startswith('linux'):
+        return None
+    peaks = [_procPeakRssKb(pid) for pid in _childProcesses()]
+    return sum(p for p in peaks if p is not None)
+
+
+class _Recorder:
+    """Collects wall time and peak RSS of measured blocks by name."""
+
+    def __init__(self):
+        # map name to list of (wall ms, peak RSS KB, child peak RSS KB)
+        self._samples = {}
+
+    @contextmanager
+    def measure(self, name):
+        QCoreApplication.processEvents()
+        gc.collect()
+        _resetPeakRss()
+        _resetChildPeakRss()
+        start = time.perf_counter()
+        yield
+        wall_ms = (time.perf_counter() - start) * 1000
+        self._samples.setdefault(name, []).append(
+            (wall_ms, _peakRssKb(), _childPeakRssKb()))
+
+    def results(self):
+        results = {}
+        for name, samples in self._samples.items():
+            wall_times = [w for w, _, _ in samples]
+            peaks = [p for _, p, _ in samples if p is not None]
+            child_peaks = [c for _, _, c in samples if c is not None]
+            results[name] = {'wall_ms': round(statistics.median(wall_times), 3),
+                             'wall_ms_min': round(min(wall_times), 3),
+                             'peak_rss_kb': max(peaks) if peaks else None,
+                             'child_peak_rss_kb':
+                                 max(child_peaks) if child_peaks else None,
+                             'runs': len(samples)}
+        return results
+
+
+def benchTabs(recorder, base_url, options):
+    """Opens tabs loading local pages through BrowserTabWidget and closes
+    them again."""
+    tab_count = options['tabs']
+    window = QMainWindow()
+    tab_widget = BrowserTabWidget(lambda: None)
+    window.setCentralWidget(tab_widget)
+    window.resize(1024, 768)
+    window.show()
+    tab_widget.addBrowserTab().load(QUrl(f'{base_url}/page/start'))
+    loaded = []
+    with recorder.measure('tabs_open'):
+        for i in range(tab_count):
+            view = tab_widget.addBrowserTab()
+            view.loadFinished.connect(loaded.append)
+            view.load(QUrl(f'{base_url}/page/{i}'))
+        _waitFor(lambda: len(loaded) >= tab_count)
+    with recorder.measure('tabs_close'):
+        while tab_widget.count() > 1:
+            tab_widget.handleTabCloseRequest(tab_widget.count() - 1)
+        _processDeferredDeletes()
+    window.close()
+    window.deleteLater()
+    _processDeferredDeletes()
+
+
+def _serializedBookmarks(count):
+    tool_bar_count = min(count, 50)
+    result = [['Tool Bar']]
+    result += [[f'https://host{i % 500}.example/page/{i}', f'Bookmark {i}']
+               for i in range(tool_bar_count)]
+    result.append(['Other Bookmarks'])
+    result += [[f'https://host{i % 500}.example/page/{i}', f'Bookmark {i}']
+               for i in range(tool_bar_count, count)]
+    return result
+
+
+def benchBookmarkModel(recorder, base_url, options):
+    """Creates and serializes the bookmark model."""
+    serialized_bookmarks = _serializedBookmarks(options['bookmarks'])
+    with recorder.measure('bookmarks_create_model'):
+        model = bookmarkwidget._createModel(None, serialized_bookmarks)
+    with recorder.measure('bookmarks_serialize_model'):
+        bookmarkwidget._serializeModel(model)
+    model.deleteLater()
+    _processDeferredDeletes()
+
+
+def benchPopulateActions(recorder, base_url, options):
+    """Populates a menu from the bookmarks and resyncs it unchanged and
+    after renaming every tenth bookmark."""
+    bookmark_widget = BookmarkWidget()
+    # One insertion instead of one per bookmark, which also keeps clear
+    # of a crash of PySide 6.12 after thousands of signal emissions
+    items = [bookmarkwidget._createItem(QUrl(entry[0]), entry[1])
+             for entry in _serializedBookmarks(options['bookmarks'])
+             if len(entry) > 1]
+    bookmark_widget.model().item(1, 0).appendRows(items)
+    menu = QMenu()
+    with recorder.measure('bookmarks_populate_actions'):
+        bookmark_widget.populateOther(menu, 0)
+    with recorder.measure('bookmarks_resync_actions'):
+        bookmark_widget.populateOther(menu, 0)
+    other_item = bookmark_widget.model().item(1, 0)
+    for r in range(0, other_item.rowCount(), 10):
+        item = other_item.child(r)
+        item.setText(item.text() + ' (renamed)')
+    with recorder.measure('bookmarks_resync_changed_actions'):
+        bookmark_widget.populateOther(menu, 0)
+    menu.deleteLater()
+    bookmark_widget.deleteLater()
+    _processDeferredDeletes()
+
+
+# A QWebEngineHistory cannot be filled without navigating, HistoryModel
+# only needs its count() and itemAt().
+class _HistoryItem:
+
+    def __init__(self, url, title):
+        self._url = url
+        self._title = title
+
+    def url(self):
+        return self._url
+
+    def title(self):
+        return self._title
+
+
+class _History:
+
+    def __init__(self, items):
+        self._items = items
+
+    def count(self):
+        return len(self._items)
+
+    def itemAt(self, i):
+        return self._items[i]
+
+
+def benchHistory(recorder, base_url, options):
+    """Reads all rows of a HistoryModel, opens a HistoryWindow on the
+    history and refreshes it, which resizes its title column."""
+    history = _History([_HistoryItem(QUrl(f'{base_url}/page/{i}'), f'Page {i}')
+                        for i in range(options['history'])])
+    model = HistoryModel(history)
+    with recorder.measure('history_model_data'):
+        for row in range(model.rowCount()):
+            title_index = model.index(row, 0)
+            model.data(title_index)
+            model.data(title_index, Qt.DecorationRole)
+            model.data(model.index(row, 1))
+    model.deleteLater()
+    window = QMainWindow()
+    window.resize(1024, 768)
+    window.show()
+    with recorder.measure('history_window_open'):
+        history_window = HistoryWindow(history, window)
+        history_window.setWindowFlags(history_window.windowFlags() | Qt.Window)
+        history_window.show()
+        QCoreApplication.processEvents()
+    with recorder.measure('history_window_refresh'):
+        history_window.refresh()
+        QCoreApplication.processEvents()
+    window.close()
+    window.deleteLater()
+    _processDeferredDeletes()
+
+
+def _historyData(base_url, page_count):
+    """Returns the serialized history of a view that navigated through
+    page_count local pages."""
+    tab_widget = BrowserTabWidget(lambda: None)
+    view = tab_widget.addBrowserTab()
+    for i in range(page_count):
+        loaded = []
+        view.loadFinished.connect(loaded.append)
+        view.load(QUrl(f'{base_url}/page/history-{i}'))
+        _waitFor(lambda: loaded)
+        view.loadFinished.disconnect(loaded.append)
+    history = bytes(view.historyData().toBase64()).decode('ascii')
+    tab_widget.deleteLater()
+    _processDeferredDeletes()
+    return history
+
+
+def benchSession(recorder, base_url, options):
+    """Reads a session of tabs with a few history entries each and
+    restores it into a BrowserTabWidget, until the current tab loaded."""
+    history = _historyData(base_url, 5)
+    tabs = [{'id': i + 1, 'url': f'{base_url}/page/{i}', 'title': f'Page {i}',
+             'zoom': 1.0, 'history': history}
+            for i in range(options['session_tabs'])]
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, 'session.json'), 'w') as f:
+        json.dump({'windows': {'1': {'tabs': tabs, 'current': 0}}}, f)
+    window = QMainWindow()
+    tab_widget = BrowserTabWidget(lambda: None)
+    window.setCentralWidget(tab_widget)
+    window.resize(1024, 768)
+    window.show()
+    with recorder.measure('session_restore'):
+        state = readSession(directory)['1']
+        tab_widget.restoreSessionState(state)
+        view = tab_widget.currentWidget()
+        loaded = []
+        view.loadFinished.connect(loaded.append)
+        _waitFor(lambda: loaded)
+    window.close()
+    window.deleteLater()
+    _processDeferredDeletes()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchDownloads(recorder, base_url, options):
+    """Downloads files from the local server, tracking them with
+    DownloadWidgets."""
+    download_count = options['downloads']
+    size = options['download_size']
+    profile = QWebEngineProfile()  # off the record, without disk cache
+    page = QWebEnginePage(profile)
+    directory = tempfile.TemporaryDirectory()
+    downloads = []
+    widgets = []
+
+    def downloadRequested(download):
+        download.setDownloadDirectory(directory.name)
+        download.setDownloadFileName(f'download-{len(downloads)}.bin')
+        download.accept()
+        downloads.append(download)
+        widgets.append(DownloadWidget(download))
+
+    profile.downloadRequested.connect(downloadRequested)
+    with recorder.measure('downloads'):
+        for i in range(download_count):
+            page.download(QUrl(f'{base_url}/download/{size}'))
+        _waitFor(lambda: len(downloads) == download_count
+                 and all(d.isFinished() for d in downloads))
+    for widget in widgets:
+        widget.deleteLater()
+    page.deleteLater()
+    _processDeferredDeletes()
+    directory.cleanup()
+
+
+_benchmarks = {'tabs': benchTabs, 'bookmarks': benchBookmarkModel,
+               'actions': benchPopulateActions, 'history': benchHistory,
+               'session': benchSession, 'downloads': benchDownloads}
+
+
+def environment():
+    """Returns what the results depend on besides the code."""
+    return {'python': platform.python_version(), 'qt': qVersion(),
+            'pyside': pyside_version, 'platform': platform.platform(),
+            'machine': platform.machine(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'qpa_platform': QGuiApplication.platformName()}
+
+
+def environmentMismatch(report, baseline_report):
+    """Returns {key: [baseline value, value]} of the environment and
+    parameters in which report differs from baseline_report."""
+    mismatch = {}
+    for section in ('environment', 'parameters'):
+        current = report.get(section, {})
+        base = baseline_report.get(section, {})
+        for key in sorted(set(current) | set(base)):
+            if current.get(key) != base.get(key):
+                mismatch[key] = [base.get(key), current.get(key)]
+    return mismatch
+
+
+def compareWithBaseline(results, baseline, tolerance):
+    """Adds the baseline values and relative changes to results and
+    returns the names of the benchmarks that regressed."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ('wall_ms', 'peak_rss_kb', 'child_peak_rss_kb'):
+            if result.get(metric) is None or not base.get(metric):
+                continue
+            change = result[metric] / base[metric] - 1.0
+            result[f'baseline_{metric}'] = base[metric]
+            result[f'{metric}_change'] = round(change, 3)
+            if change > tolerance:
+                regressions.append(f'{name} {metric}')
+    return regressions
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    parser = QCommandLineParser()
+    parser.setApplicationDescription('Broda benchmarks')
+    parser.addHelpOption()
+    options = [
+        QCommandLineOption(['tabs'], 'Number of tabs to open (default 20).',
+                           'count', '20'),
+        QCommandLineOption(['bookmarks'], 'Number of bookmarks (default 10000).',
+                           'count', '10000'),
+        QCommandLineOption(['history'], 'Number of history entries (default 10000).',
+                           'count', '10000'),
+        QCommandLineOption(['session-tabs'], 'Number of tabs of the restored '
+                           'session (default 200).', 'count', '200'),
+        QCommandLineOption(['downloads'], 'Number of downloads (default 4).',
+                           'count', '4'),
+        QCommandLineOption(['download-size'], 'Size of a download in bytes '
+                           '(default 8 MB).', 'bytes', str(8 * 1024 * 1024)),
+        QCommandLineOption(['repeat'], 'Runs per benchmark, the median is '
+                           'reported (default 3).', 'count', '3'),
+    ]
+    for option in options:
+        parser.addOption(option)
+    only_option = QCommandLineOption(
+        ['only'], 'Comma separated benchmarks to run, of: '
+        + ', '.join(_benchmarks) + '.', 'names')
+    parser.addOption(only_option)
+    output_option = QCommandLineOption(
+        ['output'], 'Write the JSON report to <file> instead of stdout.', 'file')
+    parser.addOption(output_option)
+    baseline_option = QCommandLineOption(
+        ['baseline'], 'Compare against the report in <file>.', 'file')
+    parser.addOption(baseline_option)
+    save_baseline_option = QCommandLineOption(
+        ['save-baseline'], 'Write the results to <file> as new baseline.', 'file')
+    parser.addOption(save_baseline_option)
+    tolerance_option = QCommandLineOption(
+        ['tolerance'], 'Relative increase above which a benchmark counts as '
+        'regressed (default 0.25).', 'fraction', '0.25')
+    parser.addOption(tolerance_option)
+    parser.process(app)
+
+    # Keep the configuration (bookmarks, favicons) of the user untouched
+    QStandardPaths.setTestModeEnabled(True)
+    sizes = {option.names()[0].replace('-', '_'): int(parser.value(option))
+             for option in options}
+    names = list(_benchmarks)
+    if parser.isSet(only_option):
+        names = [n.strip() for n in parser.value(only_option).split(',')]
+        unknown = [n for n in names if n not in _benchmarks]
+        if unknown:
+            print(f'Unknown benchmarks: {", ".join(unknown)}', file=sys.stderr)
+            sys.exit(2)
+
+    server, base_url = _startServer()
+    recorder = _Recorder()
+    for name in names:
+        for run in range(sizes['repeat']):
+            _benchmarks[name](recorder, base_url, sizes)
+    server.shutdown()
+
+    results = recorder.results()
+    # Peak RSS depends on what ran before, Qt WebEngine stays loaded
+    report = {'environment': environment(),
+              'parameters': dict(sizes, benchmarks=names), 'results': results}
+    regressions = []
+    if parser.isSet(baseline_option):
+        with open(parser.value(baseline_option)) as f:
+            baseline_report = json.load(f)
+        mismatch = environmentMismatch(report, baseline_report)
+        if mismatch:
+            report['environment_mismatch'] = mismatch
+            print('Warning: the baseline was taken in a different environment '
+                  'or with different parameters: '
+                  + ', '.join(f'{key} {base} -> {value}'
+                              for key, (base, value) in mismatch.items()),
+                  file=sys.stderr)
+        regressions = compareWithBaseline(
+            results, baseline_report.get('results', {}),
+            float(parser.value(tolerance_option)))
+        report['regressions'] = regressions
+    if parser.isSet(save_baseline_option):
+        with open(parser.value(save_baseline_option), 'w') as f:
+            json.dump(report, f, indent=4)
+    text = json.dumps(report, indent=4)
+    if parser.isSet(output_option):
+        with open(parser.value(output_option), 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    sys.exit(1 if regressions else 0)
@@ -1,14 +1,20 @@
 import json
 import os
 import warnings
+from functools import partial
 
+import faviconstore
 from PySide6 import QtCore
-from PySide6.QtCore import QDir, QFileInfo, QStandardPaths, Qt, QUrl
-from PySide6.QtGui import QIcon, QStandardItem, QStandardItemModel
-from PySide6.QtWidgets import QMenu, QMessageBox, QTreeView
+from PySide6.QtCore import (QDir, QFileInfo, QPersistentModelIndex,
+                            QStandardPaths, Qt, QTimer, QUrl)
+from PySide6.QtGui import QStandardItem, QStandardItemModel
+from PySide6.QtWidgets import QMenu, QMessageBox, QStyle, QTreeView
 
 _url_role = Qt.UserRole + 1
 
+# Delay for coalescing favicon updates of the tool bar and menu
+_icon_update_delay = 500
+
 # Default bookmarks as an array of arrays which is the form
 # used to read from/write to a .json bookmarks file
 _default_bookmarks = [
@@ -22,7 +28,7 @@ _default_bookmarks = [
     ['Other Bookmarks']
 ]
 
-def _configDir():
+def configDir():
     location = QStandardPaths.writableLocation(QStandardPaths.ConfigLocation)
     return f'{location}/QtForPythonBrowser'
 
@@ -36,52 +42,82 @@ def _createFolderItem(title):
     return result
 
 
-def _createItem(url, title, icon):
+def _createItem(url, title):
     result = QStandardItem(title)
     result.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
     result.setData(url, _url_role)
-    if icon is not None:
-        result.setIcon(icon)
     return result
 
 
-# Create the model from an array of arrays
+# The icons of the bookmarks are not stored in the items, they are
+# looked up in the FaviconStore when a bookmark is painted.
+class _BookmarkModel(QStandardItemModel):
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DecorationRole:
+            url = super().data(index, _url_role)
+            if url is not None:
+                return faviconstore.FaviconStore.instance().icon(url)
+        return super().data(index, role)
+
+
+# Create the items of the entries of a folder, nested folders being
+# [title, [entries]]. Icon files of entries written by older versions
+# are moved into the FaviconStore.
+def _createItems(entries):
+    result = []
+    for entry in entries:
+        if isinstance(entry[1], list):
+            folder_item = _createFolderItem(entry[0])
+            folder_item.appendRows(_createItems(entry[1]))
+            result.append(folder_item)
+        else:
+            url = QUrl.fromUserInput(entry[0])
+            title = entry[1]
+            if len(entry) > 2 and entry[2]:
+                store = faviconstore.FaviconStore.instance()
+                store.importIconFile(url, entry[2])
+            result.append(_createItem(url, title))
+    return result
+
+
+# Create the model from an array of arrays. The items of a folder are
+# added before the folder is, which does not notify anyone.
 def _createModel(parent, serialized_bookmarks):
-    result = QStandardItemModel(0, 1, parent)
-    last_folder_item = None
+    result = _BookmarkModel(0, 1, parent)
+    folder_entries = []
     for entry in serialized_bookmarks:
         if len(entry) == 1:
-            last_folder_item = _createFolderItem(entry[0])
-            result.appendRow(last_folder_item)
+            folder_entries.append((entry[0], []))
         else:
-            url = QUrl.fromUserInput(entry[0])
-            title = entry[1]
-            icon = QIcon(entry[2]) if len(entry) > 2 and entry[2] else None
-            last_folder_item.appendRow(_createItem(url, title, icon))
+            folder_entries[-1][1].append(entry)
+    for title, entries in folder_entries:
+        folder_item = _createFolderItem(title)
+        folder_item.appendRows(_createItems(entries))
+        result.appendRow(folder_item)
+    return result
+
+
+def _serializeItems(folder_item):
+    result = []
+    for i in range(0, folder_item.rowCount()):
+        item = folder_item.child(i)
+        url = item.data(_url_role)
+        if url is None:
+            result.append([item.text(), _serializeItems(item)])
+        else:
+            result.append([url.toString(), item.text()])
     return result
 
 
-# Serialize model into an array of arrays, writing out the icons
-# into .png files under directory in the process
-def _serializeModel(model, directory):
+# Serialize model into an array of arrays
+def _serializeModel(model):
     result = []
     folder_count = model.rowCount()
     for f in range(0, folder_count):
         folder_item = model.item(f)
         result.append([folder_item.text()])
-        item_count = folder_item.rowCount()
-        for i in range(0, item_count):
-            item = folder_item.child(i)
-            entry = [item.data(_url_role).toString(), item.text()]
-            icon = item.icon()
-            if not icon.isNull():
-                icon_sizes = icon.availableSizes()
-                largest_size = icon_sizes[len(icon_sizes) - 1]
-                w = largest_size.width()
-                icon_file_name = f'{directory}/icon{f:02}_{i:02}_{w}.png'
-                icon.pixmap(largest_size).save(icon_file_name, 'PNG')
-                entry.append(icon_file_name)
-            result.append(entry)
+        result.extend(_serializeItems(folder_item))
     return result
 
 
@@ -92,6 +128,8 @@ class BookmarkWidget(QTreeView):
 
     open_bookmark = QtCore.Signal(QUrl)
     open_bookmark_in_new_tab = QtCore.Signal(QUrl)
+    open_archived_bookmark = QtCore.Signal(QUrl)
+    bookmark_hovered = QtCore.Signal(QUrl)
     changed = QtCore.Signal()
 
     def __init__(self):
@@ -103,22 +141,48 @@ class BookmarkWidget(QTreeView):
         self.setModel(self._model)
         self.expandAll()
         self.activated.connect(self._activated)
+        self.setMouseTracking(True)
+        self.entered.connect(self._entered)
         self._model.rowsInserted.connect(self._changed)
         self._model.rowsRemoved.connect(self._changed)
         self._model.dataChanged.connect(self._changed)
         self._modified = False
+        self._folder_icon = self.style().standardIcon(QStyle.SP_DirIcon)
+        self._icon_update_timer = QTimer(self)
+        self._icon_update_timer.setSingleShot(True)
+        self._icon_update_timer.setInterval(_icon_update_delay)
+        self._icon_update_timer.timeout.connect(self._updateIcons)
+        store = faviconstore.FaviconStore.instance()
+        store.icon_changed.connect(self._icon_update_timer.start)
+
+    # Repaint the tree and let the tool bar and menu pick up new icons
+    def _updateIcons(self):
+        self.viewport().update()
+        self.changed.emit()
 
     def _changed(self):
         self._modified = True
         self.changed.emit()
 
     def _activated(self, index):
-        item = self._model.itemFromIndex(index)
-        self.open_bookmark.emit(item.data(_url_role))
+        url = self._model.itemFromIndex(index).data(_url_role)
+        if url is not None:
+            self.open_bookmark.emit(url)
 
     def _actionActivated(self, index):
-        action = self.sender()
-        self.open_bookmark.emit(action.data())
+        url = self.sender().data()
+        if url is not None:
+            self.open_bookmark.emit(url)
+
+    def _entered(self, index):
+        url = self._model.itemFromIndex(index).data(_url_role)
+        if url is not None:
+            self.bookmark_hovered.emit(url)
+
+    def _actionHovered(self):
+        url = self.sender().data()
+        if url is not None:
+            self.bookmark_hovered.emit(url)
 
     def _toolBarItem(self):
         return self._model.item(0, 0)
@@ -127,16 +191,63 @@ class BookmarkWidget(QTreeView):
         return self._model.item(1, 0)
 
     def addBookmark(self, url, title, icon):
-        self._otherItem().appendRow(_createItem(url, title, icon))
+        faviconstore.FaviconStore.instance().setIcon(url, icon)
+        self._otherItem().appendRow(_createItem(url, title))
 
     def addToolbarBookmark(self, url, title, icon):
-        self._toolBarItem().appendRow(_createItem(url, title, icon))
+        faviconstore.FaviconStore.instance().setIcon(url, icon)
+        self._toolBarItem().appendRow(_createItem(url, title))
+
+    def addFolder(self, folder_item):
+        """Adds a folder item with its bookmarks to the other bookmarks."""
+        self._otherItem().appendRow(folder_item)
+
+    def urls(self):
+        """Returns the URLs of all bookmarks."""
+        result = []
+        folder_items = [self._model.item(f) for f in range(0, self._model.rowCount())]
+        while folder_items:
+            folder_item = folder_items.pop()
+            for i in range(0, folder_item.rowCount()):
+                item = folder_item.child(i)
+                url = item.data(_url_role)
+                if url is None:
+                    folder_items.append(item)
+                else:
+                    result.append(url)
+        return result
+
+    def recentBookmarks(self, count):
+        """Returns (url, title) of the last count bookmarks added to the
+        other bookmarks, newest first."""
+        result = []
+        other_item = self._otherItem()
+        r = other_item.rowCount() - 1
+        while r >= 0 and len(result) < count:
+            item = other_item.child(r)
+            url = item.data(_url_role)
+            if url is not None:
+                result.append((url, item.text()))
+            r = r - 1
+        return result
+
+    # Nested folders become submenus, which are only populated when shown
+    def _folderMenu(self, folder_item, parent):
+        menu = QMenu(parent)
+        index = QPersistentModelIndex(folder_item.index())
+        menu.aboutToShow.connect(partial(self._populateFolderMenu, menu, index))
+        return menu
+
+    def _populateFolderMenu(self, menu, index):
+        if index.isValid():
+            self._populateActions(self._model.itemFromIndex(index), menu, 0)
 
     # Synchronize the bookmarks under parent_item to a target_object
     # like QMenu/QToolBar, which has a list of actions. Update
     # the existing actions, append new ones if needed or hide
     # superfluous ones
     def _populateActions(self, parent_item, target_object, first_action):
+        store = faviconstore.FaviconStore.instance()
         existing_actions = target_object.actions()
         existing_action_count = len(existing_actions)
         a = first_action
@@ -144,22 +255,30 @@ class BookmarkWidget(QTreeView):
         for r in range(0, row_count):
             item = parent_item.child(r)
             title = item.text()
-            icon = item.icon()
             url = item.data(_url_role)
+            icon = self._folder_icon if url is None else store.icon(url)
             if a < existing_action_count:
                 action = existing_actions[a]
-                if (title != action.toolTip()):
+                if (title != action.toolTip()
+                        or (url is None) != (action.menu() is not None)):
                     action.setText(BookmarkWidget.shortTitle(title))
                     action.setIcon(icon)
                     action.setToolTip(title)
                     action.setData(url)
+                    action.setMenu(self._folderMenu(item, target_object)
+                                   if url is None else None)
                     action.setVisible(True)
+                elif icon.cacheKey() != action.icon().cacheKey():
+                    action.setIcon(icon)
             else:
                 short_title = BookmarkWidget.shortTitle(title)
                 action = target_object.addAction(icon, short_title)
                 action.setToolTip(title)
                 action.setData(url)
+                if url is None:
+                    action.setMenu(self._folderMenu(item, target_object))
                 action.triggered.connect(self._actionActivated)
+                action.hovered.connect(self._actionHovered)
             a = a + 1
         while a < existing_action_count:
             existing_actions[a].setVisible(False)
@@ -182,13 +301,19 @@ class BookmarkWidget(QTreeView):
     def contextMenuEvent(self, event):
         context_menu = QMenu()
         open_in_new_tab_action = context_menu.addAction("Open in New Tab")
+        open_archived_action = context_menu.addAction("Open Archived Copy")
         remove_action = context_menu.addAction("Remove...")
         current_item = self._currentItem()
-        open_in_new_tab_action.setEnabled(current_item is not None)
+        is_bookmark = (current_item is not None
+                       and current_item.data(_url_role) is not None)
+        open_in_new_tab_action.setEnabled(is_bookmark)
+        open_archived_action.setEnabled(is_bookmark)
         remove_action.setEnabled(current_item is not None)
         chosen_action = context_menu.exec(event.globalPos())
         if chosen_action == open_in_new_tab_action:
-            self.open_bookmarkInNewTab.emit(current_item.data(_url_role))
+            self.open_bookmark_in_new_tab.emit(current_item.data(_url_role))
+        elif chosen_action == open_archived_action:
+            self.open_archived_bookmark.emit(current_item.data(_url_role))
         elif chosen_action == remove_action:
             self._removeItem(current_item)
 
@@ -202,7 +327,7 @@ class BookmarkWidget(QTreeView):
     def writeBookmarks(self):
         if not self._modified:
             return
-        dir_path = _configDir()
+        dir_path = configDir()
         native_dir_path = QDir.toNativeSeparators(dir_path)
         directory = QFileInfo(dir_path)
         if not directory.isDir():
@@ -211,14 +336,14 @@ class BookmarkWidget(QTreeView):
                 warnings.warn(f'Cannot create {native_dir_path}.',
                               RuntimeWarning)
                 return
-        serialized_model = _serializeModel(self._model, dir_path)
+        serialized_model = _serializeModel(self._model)
         bookmark_file_name = os.path.join(native_dir_path, _bookmark_file)
         print(f'Writing {bookmark_file_name}...')
         with open(bookmark_file_name, 'w') as bookmark_file:
             json.dump(serialized_model, bookmark_file, indent=4)
 
     def _readBookmarks(self):
-        bookmark_file_name = os.path.join(QDir.toNativeSeparators(_configDir()),
+        bookmark_file_name = os.path.join(QDir.toNativeSeparators(configDir()),
                                           _bookmark_file)
         if os.path.exists(bookmark_file_name):
             print(f'Reading {bookmark_file_name}...')
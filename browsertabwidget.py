@@ -1,29 +1,184 @@
 from functools import partial
 
+import loadtelemetry
+import speculation
 from bookmarkwidget import BookmarkWidget
+from faviconstore import FaviconStore
 from webengineview import WebEngineView
 from historywindow import HistoryWindow
+from newtabpage import NewTabPage
+from pagearchive import PageArchiver, isOffline
+from stallwatchdog import timedSlot
+from tabstateaggregator import ACTIONS, ICON, TITLE, URL, TabStateAggregator
+from tabthumbnailcache import TabThumbnailCache
 from PySide6 import QtCore
-from PySide6.QtCore import Qt, QUrl
-from PySide6.QtWidgets import QMenu, QTabBar, QTabWidget
+from PySide6.QtCore import (QByteArray, QEvent, QMimeData, QPoint, Qt,
+                            QTimer, QUrl)
+from PySide6.QtGui import QCursor, QDrag, QMouseEvent
+from PySide6.QtWidgets import (QApplication, QMenu, QTabBar, QTabWidget,
+                               QWidget)
 from PySide6.QtWebEngineCore import QWebEngineDownloadRequest, QWebEnginePage
 
 
+_tab_mime_type = 'application/x-qtforpythonbrowser-tab'
+
+# Delay after loadFinished before grabbing a thumbnail, to let it paint
+_thumbnail_delay = 500
+
+# Keys that switch tabs with Ctrl in QTabWidget.keyPressEvent()
+_tab_switch_keys = (Qt.Key_Tab, Qt.Key_Backtab, Qt.Key_PageUp,
+                    Qt.Key_PageDown)
+
+
+# Stands in for a restored tab until it is first activated, so that
+# restoring a session creates neither a WebEngineView nor a page for the
+# tabs in the background. It answers what is asked of any tab from the
+# session state of the tab.
+class _TabPlaceholder(QWidget):
+
+    def __init__(self, tab):
+        super().__init__()
+        self._history = tab.get('history', '')  # base64 encoded
+        self._url = QUrl(tab.get('url', ''))
+        self._title = tab.get('title', '')
+        self._zoom_factor = tab.get('zoom', 1.0)
+
+    def url(self):
+        return self._url
+
+    def title(self):
+        return self._title
+
+    def zoomFactor(self):
+        return self._zoom_factor
+
+    def setZoomFactor(self, zoom_factor):
+        self._zoom_factor = zoom_factor
+
+    def isLoading(self):
+        return False
+
+    def lastLoadSucceeded(self):
+        return False
+
+    def encodedHistoryData(self):
+        return self._history
+
+    def historyData(self):
+        return QByteArray.fromBase64(self._history.encode('ascii'))
+
+
+# A tab bar whose tabs can be dragged onto the tab bar of another
+# window, or out of the window to detach them into a new one.
+class _BrowserTabBar(QTabBar):
+
+    # The tab being dragged, (BrowserTabWidget, WebEngineView)
+    _dragged_tab = None
+
+    def __init__(self, tab_widget):
+        super().__init__()
+        self._tab_widget = tab_widget
+        self._press_index = -1
+        self.setMovable(True)
+        self.setAcceptDrops(True)
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        if event.button() == Qt.LeftButton:
+            self._press_index = self.tabAt(event.position().toPoint())
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        self._press_index = -1
+
+    def mouseMoveEvent(self, event):
+        super().mouseMoveEvent(event)
+        if self._press_index < 0 or not event.buttons() & Qt.LeftButton:
+            return
+        pos = event.position().toPoint()
+        distance = QApplication.startDragDistance()
+        if -distance * 2 <= pos.y() <= self.height() + distance * 2:
+            return
+        # Left the tab bar: end the in-bar move and start a real drag
+        index = self.currentIndex()
+        release = QMouseEvent(QEvent.MouseButtonRelease, event.position(),
+                              event.globalPosition(), Qt.LeftButton,
+                              Qt.NoButton, event.modifiers())
+        super().mouseReleaseEvent(release)
+        self._press_index = -1
+        self._startDrag(index)
+
+    def _startDrag(self, index):
+        view = self._tab_widget.widget(index)
+        if view is None:
+            return
+        mime_data = QMimeData()
+        mime_data.setData(_tab_mime_type, QByteArray())
+        drag = QDrag(self)
+        drag.setMimeData(mime_data)
+        drag.setPixmap(self.grab(self.tabRect(index)))
+        _BrowserTabBar._dragged_tab = (self._tab_widget, view)
+        result = drag.exec(Qt.MoveAction)
+        _BrowserTabBar._dragged_tab = None
+        if result == Qt.IgnoreAction:
+            index = self._tab_widget.indexOf(view)
+            if index >= 0:
+                self._tab_widget.detach_requested.emit(index, QCursor.pos())
+
+    def _acceptsDrag(self, event):
+        return (event.mimeData().hasFormat(_tab_mime_type)
+                and _BrowserTabBar._dragged_tab is not None)
+
+    def dragEnterEvent(self, event):
+        if self._acceptsDrag(event):
+            event.acceptProposedAction()
+        else:
+            super().dragEnterEvent(event)
+
+    def dragMoveEvent(self, event):
+        if self._acceptsDrag(event):
+            event.acceptProposedAction()
+        else:
+            super().dragMoveEvent(event)
+
+    def dropEvent(self, event):
+        if not self._acceptsDrag(event):
+            super().dropEvent(event)
+            return
+        source, view = _BrowserTabBar._dragged_tab
+        event.acceptProposedAction()
+        if source is not self._tab_widget:
+            index = self.tabAt(event.position().toPoint())
+            view = source.takeBrowserTab(source.indexOf(view))
+            self._tab_widget.insertBrowserTab(view, index)
+
+
 class BrowserTabWidget(QTabWidget):
     """Enables having several tabs with QWebEngineView."""
 
     url_changed = QtCore.Signal(QUrl)
     enabled_changed = QtCore.Signal(QWebEnginePage.WebAction, bool)
     download_requested = QtCore.Signal(QWebEngineDownloadRequest)
+    session_changed = QtCore.Signal()
+    detach_requested = QtCore.Signal(int, QPoint)
+    last_tab_removed = QtCore.Signal()
 
     def __init__(self, window_factory_function):
         super().__init__()
+        self.setTabBar(_BrowserTabBar(self))
         self.setTabsClosable(True)
         self._window_factory_function = window_factory_function
         self._webengineviews = []
         self._history_windows = {}  # map WebengineView to HistoryWindow
         self.currentChanged.connect(self._currentChanged)
         self.tabCloseRequested.connect(self.handleTabCloseRequest)
+        self._restoring = False
+        # Tabs have ids that stay the same in a session, so that the
+        # session journal can record changes of single tabs
+        self._tab_ids = {}  # map WebEngineView to tab id
+        self._next_tab_id = 1
+        self._session_dirty = set()  # views whose session state changed
+        self._tab_state = TabStateAggregator(self._flushTabState, self)
         self._actions_enabled = {}
         for web_action in WebEngineView.webActions():
             self._actions_enabled[web_action] = False
@@ -32,24 +187,260 @@ class BrowserTabWidget(QTabWidget):
         tab_bar.setSelectionBehaviorOnRemove(QTabBar.SelectPreviousTab)
         tab_bar.setContextMenuPolicy(Qt.CustomContextMenu)
         tab_bar.customContextMenuRequested.connect(self._handleTabContextMenu)
+        tab_bar.tabMoved.connect(self._tabMoved)
+        tab_bar.tabBarClicked.connect(self._tabBarClicked)
 
+    @timedSlot
     def addBrowserTab(self):
+        index = self.count()
+        web_engine_view = self._createBrowserTab()
+        self._addBrowserTab(web_engine_view, f'Tab {index + 1}')
+        self.setCurrentIndex(index)
+        return web_engine_view
+
+    def _createBrowserTab(self):
         factory_func = partial(BrowserTabWidget.addBrowserTab, self)
         web_engine_view = WebEngineView(factory_func,
                                         self._window_factory_function)
-        index = self.count()
-        self._webengineviews.append(web_engine_view)
-        title = f'Tab {index + 1}'
-        self.addTab(web_engine_view, title)
+        loadtelemetry.attach(web_engine_view)
+        return web_engine_view
+
+    def _addBrowserTab(self, web_engine_view, title, index=-1, tab_id=None,
+                       icon=None):
+        if index < 0 or index > self.count():
+            index = self.count()
+        if tab_id is None:
+            tab_id = self._next_tab_id
+            self._session_dirty.add(web_engine_view)
+        self._next_tab_id = max(self._next_tab_id, tab_id + 1)
+        self._tab_ids[web_engine_view] = tab_id
+        self._webengineviews.insert(index, web_engine_view)
+        # The tab bar lays out all tabs for each change, set the icon along
+        if icon is None:
+            self.insertTab(index, web_engine_view, title)
+        else:
+            self.insertTab(index, web_engine_view, icon, title)
+        if not isinstance(web_engine_view, _TabPlaceholder):
+            for signal, slot in self._browserTabConnections(web_engine_view):
+                signal.connect(slot)
+        self.session_changed.emit()
+        return index
+
+    def _removeBrowserTab(self, web_engine_view):
+        self._tab_state.discard(web_engine_view)
+        self._tab_ids.pop(web_engine_view, None)
+        self._session_dirty.discard(web_engine_view)
+        self._webengineviews.remove(web_engine_view)
+
+    def _browserTabConnections(self, web_engine_view):
         page = web_engine_view.page()
-        page.titleChanged.connect(self._titleChanged)
-        page.iconChanged.connect(self._iconChanged)
-        page.profile().downloadRequested.connect(self._downloadRequested)
-        web_engine_view.urlChanged.connect(self._urlChanged)
-        web_engine_view.enabled_changed.connect(self._enabledChanged)
+        return [(web_engine_view.titleChanged, self._titleChanged),
+                (web_engine_view.iconChanged, self._iconChanged),
+                (page.profile().downloadRequested, self._downloadRequested),
+                (web_engine_view.urlChanged, self._urlChanged),
+                (web_engine_view.enabled_changed, self._enabledChanged),
+                (web_engine_view.loadFinished, self._loadFinished)]
+
+    def captureCurrentTab(self):
+        index = self.currentIndex()
+        if index >= 0 and not self._isPlaceholder(index):
+            TabThumbnailCache.instance().capture(self._webengineviews[index])
+
+    def _isPlaceholder(self, index):
+        return isinstance(self._webengineviews[index], _TabPlaceholder)
+
+    def webEngineView(self, index):
+        """Returns the WebEngineView of the tab at index, creating it if
+        the tab was restored and not activated yet."""
+        if self._isPlaceholder(index):
+            self._createRestoredView(index)
+        return self._webengineviews[index]
+
+    def loadedViews(self):
+        """Returns the WebEngineViews of the tabs that have one."""
+        return [view for view in self._webengineviews
+                if not isinstance(view, _TabPlaceholder)]
+
+    # Swaps the placeholder at index for a WebEngineView navigating to the
+    # history of the tab, keeping the tab id and the current tab
+    def _createRestoredView(self, index):
+        placeholder = self._webengineviews[index]
+        view = self._createBrowserTab()
+        view.setZoomFactor(placeholder.zoomFactor())
+        current_widget = self.currentWidget()
+        text, icon = self.tabText(index), self.tabIcon(index)
+        tab_id = self._tab_ids[placeholder]
+        dirty = placeholder in self._session_dirty
+        restoring = self._restoring
+        self._restoring = True
+        self._removeBrowserTab(placeholder)
+        self.removeTab(index)
+        self._addBrowserTab(view, text, index, tab_id, icon)
+        if dirty:
+            self._session_dirty.add(view)
+        QTabWidget.setCurrentWidget(
+            self, view if current_widget is placeholder else current_widget)
+        self._restoring = restoring
+        view.setHistoryData(placeholder.historyData())
+        placeholder.deleteLater()
+        return view
+
+    # Tabs are captured before they are deactivated, hidden tabs cannot
+    # be grabbed without rendering them again
+    def setCurrentIndex(self, index):
+        if index != self.currentIndex():
+            self.captureCurrentTab()
+        super().setCurrentIndex(index)
+
+    def setCurrentWidget(self, widget):
+        self.setCurrentIndex(self.indexOf(widget))
+
+    # tabBarClicked is emitted before the tab bar changes the current tab
+    def _tabBarClicked(self, index):
+        if (index >= 0 and index != self.currentIndex()
+                and QApplication.mouseButtons() & Qt.LeftButton):
+            self.captureCurrentTab()
+
+    def keyPressEvent(self, event):
+        if (event.key() in _tab_switch_keys and self.count() > 1
+                and event.modifiers() & Qt.ControlModifier):
+            self.captureCurrentTab()
+        super().keyPressEvent(event)
+
+    @timedSlot
+    def _loadFinished(self, ok):
+        web_engine_view = self.sender()
+        self._sessionChanged(web_engine_view)
+        if not ok and web_engine_view.url().scheme() in ('http', 'https'):
+            self._loadArchivedCopyIfOffline(web_engine_view)
+        if ok:
+            NewTabPage.instance().recordVisit(web_engine_view.url(),
+                                              web_engine_view.title())
+        if ok and web_engine_view is self.currentWidget():
+            QTimer.singleShot(_thumbnail_delay,
+                              partial(self._captureTab, web_engine_view))
+
+    def _loadArchivedCopyIfOffline(self, web_engine_view):
+        if isOffline():
+            PageArchiver.instance().requestArchivedCopy(
+                web_engine_view.url(),
+                partial(self._loadArchivedCopyInto, web_engine_view))
+
+    def loadArchivedCopy(self, url):
+        """Loads the archived copy of url into the current tab once it is
+        available."""
+        index = self.currentIndex()
+        if index >= 0:
+            PageArchiver.instance().requestArchivedCopy(
+                url, partial(self._loadArchivedCopyInto,
+                             self._webengineviews[index]))
+
+    def _loadArchivedCopyInto(self, web_engine_view, archived_url):
+        # The tab may have been closed while the copy was reassembled
+        if archived_url.isValid() and web_engine_view in self._webengineviews:
+            web_engine_view.setUrl(archived_url)
+
+    def savePageForOffline(self):
+        index = self.currentIndex()
+        if index >= 0:
+            PageArchiver.instance().savePage(self._webengineviews[index].page())
+
+    def _captureTab(self, web_engine_view):
+        if web_engine_view in self._webengineviews:
+            TabThumbnailCache.instance().capture(web_engine_view)
+
+    @timedSlot
+    def takeBrowserTab(self, index):
+        """Removes the tab at index without destroying its WebEngineView,
+        which keeps its renderer and state, and returns the view."""
+        web_engine_view = self.webEngineView(index)
+        for signal, slot in self._browserTabConnections(web_engine_view):
+            signal.disconnect(slot)
+        self._history_windows.pop(web_engine_view, None)
+        self._removeBrowserTab(web_engine_view)
+        self.removeTab(index)
+        self.session_changed.emit()
+        if self.count() == 0:
+            self.last_tab_removed.emit()
+        return web_engine_view
+
+    @timedSlot
+    def insertBrowserTab(self, web_engine_view, index=-1):
+        """Adds a WebEngineView taken from another BrowserTabWidget."""
+        web_engine_view.setTabFactoryFunction(
+            partial(BrowserTabWidget.addBrowserTab, self))
+        title = BookmarkWidget.shortTitle(web_engine_view.title())
+        index = self._addBrowserTab(web_engine_view, title, index)
+        self.setTabIcon(index, self._viewIcon(web_engine_view))
         self.setCurrentIndex(index)
+        return index
+
+    @timedSlot
+    def duplicateTab(self, index):
+        """Opens a new tab with a copy of the history of the tab at index,
+        so that its page can be served from the cache."""
+        history_data = self._webengineviews[index].historyData()
+        web_engine_view = self.addBrowserTab()
+        web_engine_view.setHistoryData(history_data)
         return web_engine_view
 
+    @timedSlot
+    def _tabMoved(self, from_index, to_index):
+        web_engine_view = self._webengineviews.pop(from_index)
+        self._webengineviews.insert(to_index, web_engine_view)
+        self.session_changed.emit()
+
+    def _sessionChanged(self, web_engine_view):
+        if web_engine_view in self._tab_ids:
+            self._session_dirty.add(web_engine_view)
+            self.session_changed.emit()
+
+    # The history is passed on as QByteArray, the session store encodes
+    # it off the GUI thread
+    def _tabSessionState(self, view):
+        if isinstance(view, _TabPlaceholder):
+            history = view.encodedHistoryData()
+        else:
+            history = view.historyData()
+        return {'id': self._tab_ids[view], 'url': view.url().toString(),
+                'title': view.title(), 'zoom': view.zoomFactor(),
+                'history': history}
+
+    def sessionState(self):
+        """Returns the tabs as a dict for the SessionStore."""
+        tabs = [self._tabSessionState(view) for view in self._webengineviews]
+        return {'tabs': tabs, 'current': self.currentIndex()}
+
+    def sessionChanges(self, all_tabs=False):
+        """Returns the tab ids in order, the current index and the states
+        of the tabs that changed since the last call (or of all tabs) as
+        {id: state}."""
+        views = self._webengineviews if all_tabs else self._session_dirty
+        changed = {self._tab_ids[view]: self._tabSessionState(view)
+                   for view in views}
+        self._session_dirty.clear()
+        tab_ids = [self._tab_ids[view] for view in self._webengineviews]
+        return tab_ids, self.currentIndex(), changed
+
+    def restoreSessionState(self, state):
+        """Adds the tabs of a sessionState(). Only the current tab gets a
+        WebEngineView and is loaded, the others get theirs when they are
+        activated."""
+        self._restoring = True
+        first_index = self.count()
+        for tab in state.get('tabs', []):
+            placeholder = _TabPlaceholder(tab)
+            title = BookmarkWidget.shortTitle(placeholder.title())
+            icon = FaviconStore.instance().icon(placeholder.url())
+            self._addBrowserTab(placeholder, title, tab_id=tab.get('id'),
+                                icon=icon)
+        self._restoring = False
+        current = first_index + state.get('current', 0)
+        if first_index <= current < self.count():
+            self.setCurrentIndex(current)
+            self._currentChanged(current)
+
+    @timedSlot
     def load(self, url):
         index = self.currentIndex()
         if index >= 0 and url.isValid():
@@ -64,41 +455,76 @@ class BrowserTabWidget(QTabWidget):
         index = self.currentIndex()
         return self._webengineviews[index].url() if index >= 0 else QUrl()
 
+    # Tab state changes are only recorded here and applied to the tab bar
+    # and the window by _flushTabState() once per event loop iteration
     def _urlChanged(self, url):
-        index = self.currentIndex()
-        if index >= 0 and self._webengineviews[index] == self.sender():
-                self.url_changed.emit(url)
+        self._tab_state.markDirty(self.sender(), URL)
+        speculation.navigated(url)
 
     def _titleChanged(self, title):
-        index = self._indexOfPage(self.sender())
-        if (index >= 0):
-            self.setTabText(index, BookmarkWidget.shortTitle(title))
+        self._tab_state.markDirty(self.sender(), TITLE)
 
     def _iconChanged(self, icon):
-        index = self._indexOfPage(self.sender())
-        if (index >= 0):
-            self.setTabIcon(index, icon)
+        self._tab_state.markDirty(self.sender(), ICON)
 
     def _enabledChanged(self, web_action, enabled):
-        index = self.currentIndex()
-        if index >= 0 and self._webengineviews[index] == self.sender():
-            self._checkEmitEnabledChanged(web_action, enabled)
+        self._tab_state.markDirty(self.sender(), ACTIONS)
+
+    @timedSlot
+    def _flushTabState(self, dirty):
+        current_view = self.currentWidget()
+        session_changed = False
+        for view, flags in dirty.items():
+            index = self.indexOf(view)
+            if index < 0:
+                continue
+            if flags & TITLE:
+                self.setTabText(index, BookmarkWidget.shortTitle(view.title()))
+            if flags & ICON:
+                self.setTabIcon(index, self._viewIcon(view))
+            if flags & (URL | TITLE):
+                self._session_dirty.add(view)
+                session_changed = True
+            if view is current_view:
+                if flags & ACTIONS:
+                    self._updateActions(view)
+                if flags & URL:
+                    self.url_changed.emit(view.url())
+        if session_changed:
+            self.session_changed.emit()
+
+    # Record the icon of a page in the FaviconStore, falling back to the
+    # stored one while a page has none yet or is not loaded
+    def _viewIcon(self, web_engine_view):
+        icon = web_engine_view.icon()
+        store = FaviconStore.instance()
+        if icon.isNull():
+            return store.icon(web_engine_view.url())
+        store.setIcon(web_engine_view.url(), icon)
+        return icon
+
+    def stateStatistics(self):
+        """Returns counters of the coalesced tab state updates."""
+        return self._tab_state.statistics()
 
     def _checkEmitEnabledChanged(self, web_action, enabled):
         if enabled != self._actions_enabled[web_action]:
             self._actions_enabled[web_action] = enabled
             self.enabled_changed.emit(web_action, enabled)
 
+    @timedSlot
     def _currentChanged(self, index):
-        self._updateActions(index)
-        self.url_changed.emit(self.url())
+        if self._restoring:
+            return
+        self.session_changed.emit()
+        if 0 <= index < len(self._webengineviews):
+            view = self.webEngineView(index)
+            self._tab_state.markDirty(view, ACTIONS | URL)
 
-    def _updateActions(self, index):
-        if index >= 0 and index < len(self._webengineviews):
-            view = self._webengineviews[index]
-            for web_action in WebEngineView.webActions():
-                enabled = view.isWebActionEnabled(web_action)
-                self._checkEmitEnabledChanged(web_action, enabled)
+    def _updateActions(self, view):
+        for web_action in WebEngineView.webActions():
+            enabled = view.isWebActionEnabled(web_action)
+            self._checkEmitEnabledChanged(web_action, enabled)
 
     def back(self):
         self._triggerAction(QWebEnginePage.Back)
@@ -127,6 +553,7 @@ class BrowserTabWidget(QTabWidget):
     def selectAll(self):
         self._triggerAction(QWebEnginePage.SelectAll)
 
+    @timedSlot
     def showHistory(self):
         index = self.currentIndex()
         if index >= 0:
@@ -136,6 +563,7 @@ class BrowserTabWidget(QTabWidget):
                 history = webengineview.page().history()
                 history_window = HistoryWindow(history, self)
                 history_window.open_url.connect(self.load)
+                history_window.open_archived_url.connect(self.loadArchivedCopy)
                 history_window.setWindowFlags(history_window.windowFlags()
                                               | Qt.Window)
                 history_window.setWindowTitle('History')
@@ -148,9 +576,12 @@ class BrowserTabWidget(QTabWidget):
     def zoomFactor(self):
         return self._webengineviews[0].zoomFactor() if self._webengineviews else 1.0
 
+    @timedSlot
     def setZoomFactor(self, z):
         for w in self._webengineviews:
             w.setZoomFactor(z)
+        self._session_dirty.update(self._webengineviews)
+        self.session_changed.emit()
 
     def _handleTabContextMenu(self, point):
         index = self.tabBar().tabAt(point)
@@ -159,6 +590,8 @@ class BrowserTabWidget(QTabWidget):
         tab_count = len(self._webengineviews)
         context_menu = QMenu()
         duplicate_tab_action = context_menu.addAction("Duplicate Tab")
+        detach_tab_action = context_menu.addAction("Move to New Window")
+        detach_tab_action.setEnabled(tab_count > 1)
         close_other_tabs_action = context_menu.addAction("Close Other Tabs")
         close_other_tabs_action.setEnabled(tab_count > 1)
         close_tabs_to_the_right_action = context_menu.addAction("Close Tabs to the Right")
@@ -166,8 +599,9 @@ class BrowserTabWidget(QTabWidget):
         close_tab_action = context_menu.addAction("&Close Tab")
         chosen_action = context_menu.exec(self.tabBar().mapToGlobal(point))
         if chosen_action == duplicate_tab_action:
-            current_url = self.url()
-            self.addBrowserTab().load(current_url)
+            self.duplicateTab(index)
+        elif chosen_action == detach_tab_action:
+            self.detach_requested.emit(index, QPoint())
         elif chosen_action == close_other_tabs_action:
             for t in range(tab_count - 1, -1, -1):
                 if t != index:
@@ -178,13 +612,19 @@ class BrowserTabWidget(QTabWidget):
         elif chosen_action == close_tab_action:
             self.handleTabCloseRequest(index)
 
+    @timedSlot
     def handleTabCloseRequest(self, index):
         if (index >= 0 and self.count() > 1):
             webengineview = self._webengineviews[index]
-            if self._history_windows.get(webengineview):
-                del self._history_windows[webengineview]
-            self._webengineviews.remove(webengineview)
+            history_window = self._history_windows.pop(webengineview, None)
+            if history_window:
+                history_window.deleteLater()
+            TabThumbnailCache.instance().remove(webengineview)
+            self._removeBrowserTab(webengineview)
             self.removeTab(index)
+            # removeTab() keeps the view, release its page and renderer
+            webengineview.deleteLater()
+            self.session_changed.emit()
 
     def closeCurrentTab(self):
         self.handleTabCloseRequest(self.currentIndex())
@@ -194,11 +634,5 @@ class BrowserTabWidget(QTabWidget):
         if index >= 0:
             self._webengineviews[index].page().triggerAction(action)
 
-    def _indexOfPage(self, web_page):
-        for p in range(0, len(self._webengineviews)):
-            if (self._webengineviews[p].page() == web_page):
-                return p
-        return -1
-
     def _downloadRequested(self, item):
         self.download_requested.emit(item)
@@ -0,0 +1,142 @@
+import html
+import mmap
+import os
+
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice, QMimeDatabase, QUrl
+from PySide6.QtWebEngineCore import (QWebEngineUrlRequestJob, QWebEngineUrlScheme,
+                                     QWebEngineUrlSchemeHandler)
+
+_scheme = b'broda-data'
+
+
+def registerScheme():
+    """Registers broda-data://<root>/<path>, which needs to happen before
+    the QApplication is created."""
+    scheme = QWebEngineUrlScheme(_scheme)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    # Local, so that web pages cannot embed or probe the served files
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme
+                    | QWebEngineUrlScheme.LocalScheme
+                    | QWebEngineUrlScheme.CorsEnabled)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+# A read-only, random access QIODevice on a memory mapped file. Pages
+# are only read in as the engine reads its chunks, so seeking in a multi
+# gigabyte file does not load it into memory.
+class _MappedFileDevice(QIODevice):
+
+    def __init__(self, file_name, parent=None):
+        super().__init__(parent)
+        self._file = open(file_name, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = None
+        if self._size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self.open(QIODevice.ReadOnly)
+
+    def isSequential(self):
+        return False
+
+    def size(self):
+        return self._size
+
+    def seek(self, pos):
+        if pos < 0 or pos > self._size:
+            return False
+        return super().seek(pos)
+
+    def readData(self, max_size):
+        pos = self.pos()
+        if self._map is None or pos >= self._size:
+            return b''
+        end = min(pos + max_size, self._size)
+        return self._map[pos:end]
+
+    def writeData(self, data):
+        return -1
+
+    def close(self):
+        super().close()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+# Serves files below configured root directories, broda-data://<name>/
+# <path> maps to <root of name>/<path>. Replies are seekable devices,
+# which lets Qt WebEngine answer HTTP Range requests (206 Partial
+# Content) by seeking instead of reading the whole file.
+class DataSchemeHandler(QWebEngineUrlSchemeHandler):
+    """Serves large local data files to the browser."""
+
+    def __init__(self, roots, parent=None):
+        super().__init__(parent)
+        self._roots = {name.lower(): os.path.realpath(path)
+                       for name, path in roots.items()}
+        self._mime_database = QMimeDatabase()
+
+    @staticmethod
+    def scheme():
+        return _scheme
+
+    def install(self, profile):
+        profile.installUrlSchemeHandler(_scheme, self)
+
+    def requestStarted(self, job):
+        if job.requestMethod() != b'GET':
+            job.fail(QWebEngineUrlRequestJob.RequestDenied)
+            return
+        url = job.requestUrl()
+        root = self._roots.get(url.host().lower())
+        if root is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        relative_path = url.path(QUrl.FullyDecoded).lstrip('/')
+        path = os.path.realpath(os.path.join(root, relative_path))
+        # Do not let '..' or symbolic links escape from the root
+        if os.path.commonpath([root, path]) != root:
+            job.fail(QWebEngineUrlRequestJob.RequestDenied)
+            return
+        try:
+            if os.path.isdir(path):
+                self._replyDirectory(job, url, path)
+            else:
+                device = _MappedFileDevice(path, job)
+                mime_type = self._mime_database.mimeTypeForFile(
+                    path, QMimeDatabase.MatchExtension).name()
+                job.reply(mime_type.encode('ascii'), device)
+        except FileNotFoundError:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+        except OSError:
+            job.fail(QWebEngineUrlRequestJob.RequestFailed)
+
+    def _replyDirectory(self, job, url, path):
+        base = url.toString().rstrip('/')
+        title = html.escape(url.toString())
+        lines = [f'<!DOCTYPE html><html><head><meta charset="utf-8">'
+                 f'<title>{title}</title></head><body><h1>{title}</h1><ul>']
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            name = entry.name + ('/' if entry.is_dir() else '')
+            encoded_name = QUrl.toPercentEncoding(name, b'/').data().decode()
+            href = html.escape(f'{base}/{encoded_name}')
+            lines.append(f'<li><a href="{href}">{html.escape(name)}</a></li>')
+        lines.append('</ul></body></html>')
+        buffer = QBuffer(job)
+        buffer.setData(QByteArray('\n'.join(lines).encode('utf-8')))
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(b'text/html', buffer)
+
+
+def parseRoots(values):
+    """Parses name=path command line values into a dict."""
+    roots = {}
+    for value in values:
+        name, separator, path = value.partition('=')
+        if not separator or not name or not os.path.isdir(path):
+            raise ValueError(f'Invalid data root "{value}", '
+                             'expected <name>=<directory>')
+        roots[name] = path
+    return roots
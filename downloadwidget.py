@@ -1,3 +1,4 @@
+import os
 import sys
 from PySide6 import QtCore
 from PySide6.QtCore import QDir, QFileInfo, QStandardPaths, Qt, QUrl
@@ -15,10 +16,11 @@ class DownloadWidget(QProgressBar):
     def __init__(self, download_item):
         super().__init__()
         self._download_item = download_item
-        download_item.finished.connect(self._finished)
-        download_item.downloadProgress.connect(self._downloadProgress)
-        download_item.stateChanged.connect(self._updateToolTip())
-        path = download_item.path()
+        download_item.isFinishedChanged.connect(self._finished)
+        download_item.receivedBytesChanged.connect(self._downloadProgress)
+        download_item.totalBytesChanged.connect(self._downloadProgress)
+        download_item.stateChanged.connect(self._updateToolTip)
+        path = self._path()
         self.setMaximumWidth(300)
         # Shorten 'PySide6-5.11.0a1-5.11.0-cp36-cp36m-linux_x86_64.whl'...
         description = QFileInfo(path).fileName()
@@ -49,8 +51,12 @@ class DownloadWidget(QProgressBar):
     def state(self):
         return self._download_item.state()
 
+    def _path(self):
+        return os.path.join(self._download_item.downloadDirectory(),
+                            self._download_item.downloadFileName())
+
     def _updateToolTip(self):
-        path = self._download_item.path()
+        path = self._path()
         url_str = self._download_item.url().toString()
         native_sep = QDir.toNativeSeparators(path)
         tool_tip = f"{url_str}\n{native_sep}"
@@ -70,15 +76,20 @@ class DownloadWidget(QProgressBar):
             tool_tip += "\n(interrupted)"
         self.setToolTip(tool_tip)
 
-    def _downloadProgress(self, bytes_received, bytes_total):
-        self.setValue(int(100 * bytes_received / bytes_total))
+    def _downloadProgress(self):
+        bytes_total = self._download_item.totalBytes()
+        if bytes_total > 0:
+            bytes_received = self._download_item.receivedBytes()
+            self.setValue(int(100 * bytes_received / bytes_total))
 
     def _finished(self):
+        if not self._download_item.isFinished():
+            return
         self._updateToolTip()
         self.finished.emit()
 
     def _launch(self):
-        DownloadWidget.openFile(self._download_item.path())
+        DownloadWidget.openFile(self._path())
 
     def mouseDoubleClickEvent(self, event):
         if self.state() == QWebEngineDownloadRequest.DownloadCompleted:
@@ -100,7 +111,7 @@ class DownloadWidget(QProgressBar):
         if chosen_action == launch_action:
             self._launch()
         elif chosen_action == show_in_folder_action:
-            path = QFileInfo(self._download_item.path()).absolutePath()
+            path = self._download_item.downloadDirectory()
             DownloadWidget.openFile(path)
         elif chosen_action == cancel_action:
             self._download_item.cancel()
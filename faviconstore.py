@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import bookmarkwidget
+from PySide6 import QtCore
+from PySide6.QtCore import (QBuffer, QIODevice, QObject, QRunnable, QSize,
+                            QThreadPool, QTimer, QUrl)
+from PySide6.QtGui import QIcon
+
+_index_file = 'index.json'
+_index_write_delay = 2000
+_max_icon_size = 64
+_default_cache_size = 512
+
+
+def _pageKey(url):
+    return url.toString().partition('#')[0]
+
+
+class _SaveTaskSignals(QObject):
+    finished = QtCore.Signal(QUrl, str, list)
+
+
+# Encodes the resolutions of an icon as PNG on a pool thread and writes
+# them to <key>-<size>.png, the key being the hash of the encoded data
+# so that an icon shared by several hosts is stored once.
+class _SaveTask(QRunnable):
+
+    def __init__(self, directory, url, images, signals):
+        super().__init__()
+        self._directory = directory
+        self._url = url
+        self._images = images
+        self._signals = signals
+
+    def run(self):
+        encoded = []
+        digest = hashlib.sha1()
+        for size, image in self._images:
+            buffer = QBuffer()
+            buffer.open(QIODevice.WriteOnly)
+            image.save(buffer, 'PNG')
+            data = buffer.data().data()
+            digest.update(data)
+            encoded.append((size, data))
+        key = digest.hexdigest()
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            for size, data in encoded:
+                file_name = os.path.join(self._directory, f'{key}-{size}.png')
+                if not os.path.exists(file_name):
+                    self._write(file_name, data)
+        except OSError as e:
+            print(f'Cannot store favicon of {self._url.toString()}: {e}')
+            return
+        self._signals.finished.emit(self._url, key, [s for s, _ in encoded])
+
+    # Pages sharing an icon store the same file concurrently, each through
+    # a temporary file of its own
+    def _write(self, file_name, data):
+        fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=self._directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_name, file_name)
+        except OSError:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            # The same content, written by a concurrent task
+            if not os.path.exists(file_name):
+                raise
+
+
+# Favicons of all windows, stored as PNG files per resolution below
+# <config>/favicons. An index maps hosts to icons, pages whose icon
+# differs from the one of their host are recorded separately. Icons are
+# created on first use and kept in a least recently used cache; their
+# files are only decoded when a resolution is painted. Hence the files of
+# icons no longer referenced are only deleted when the index is read by
+# the next process, no QIcon refers to them then.
+class FaviconStore(QObject):
+    """Persistent favicon database shared by tabs, bookmarks and history."""
+
+    icon_changed = QtCore.Signal(QUrl)
+
+    _instance = None
+
+    @staticmethod
+    def instance():
+        if FaviconStore._instance is None:
+            FaviconStore._instance = FaviconStore(
+                os.path.join(bookmarkwidget.configDir(), 'favicons'))
+        return FaviconStore._instance
+
+    def __init__(self, directory, cache_size=_default_cache_size, parent=None):
+        super().__init__(parent)
+        self._directory = directory
+        self._cache_size = cache_size
+        self._index = None  # read on first use
+        self._index_modified = False
+        self._icons = OrderedDict()  # map icon key to QIcon
+        self._saved_icons = {}  # map page key to QIcon.cacheKey() last saved
+        self._signals = _SaveTaskSignals()
+        self._signals.finished.connect(self._saved)
+        self._write_timer = QTimer(self)
+        self._write_timer.setSingleShot(True)
+        self._write_timer.setInterval(_index_write_delay)
+        self._write_timer.timeout.connect(self.flush)
+
+    def _loadedIndex(self):
+        if self._index is None:
+            self._index = {'hosts': {}, 'pages': {}, 'icons': {},
+                           'unreferenced': {}}
+            try:
+                with open(os.path.join(self._directory, _index_file)) as f:
+                    self._index.update(json.load(f))
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f'Cannot read the favicon index: {e}')
+            self._removeUnreferenced()
+        return self._index
+
+    def _removeUnreferenced(self):
+        unreferenced = self._index['unreferenced']
+        if not unreferenced:
+            return
+        for key, sizes in unreferenced.items():
+            for size in sizes:
+                try:
+                    os.remove(os.path.join(self._directory, f'{key}-{size}.png'))
+                except OSError:
+                    pass
+        unreferenced.clear()
+        self._index_modified = True
+        self._write_timer.start()
+
+    def _iconKey(self, url):
+        index = self._loadedIndex()
+        key = index['pages'].get(_pageKey(url))
+        if key is None and url.host():
+            key = index['hosts'].get(url.host().lower())
+        return key
+
+    def hasIcon(self, url):
+        return self._iconKey(url) is not None
+
+    def icon(self, url):
+        """Returns the icon of a page or of its host, or a null QIcon."""
+        key = self._iconKey(url)
+        if key is None:
+            return QIcon()
+        icon = self._icons.get(key)
+        if icon is not None:
+            self._icons.move_to_end(key)
+            return icon
+        icon = QIcon()
+        for size in self._index['icons'].get(key, []):
+            # Passing the size lets QIcon defer reading the file
+            icon.addFile(os.path.join(self._directory, f'{key}-{size}.png'),
+                         QSize(size, size))
+        self._icons[key] = icon
+        if len(self._icons) > self._cache_size:
+            self._icons.popitem(last=False)
+        return icon
+
+    def iconFile(self, url, size):
+        """Returns the PNG file of the icon of a page in the smallest
+        resolution of at least size (else the largest one), or None."""
+        key = self._iconKey(url)
+        sizes = self._index['icons'].get(key) if key else None
+        if not sizes:
+            return None
+        best = next((s for s in sorted(sizes) if s >= size), max(sizes))
+        return os.path.join(self._directory, f'{key}-{best}.png')
+
+    def setIcon(self, url, icon):
+        """Stores the icon of a page, encoding it on a pool thread."""
+        if icon.isNull() or url.scheme() not in ('http', 'https', 'file'):
+            return
+        page_key = _pageKey(url)
+        if self._saved_icons.get(page_key) == icon.cacheKey():
+            return
+        if len(self._saved_icons) > _default_cache_size:
+            self._saved_icons.clear()
+        self._saved_icons[page_key] = icon.cacheKey()
+        sizes = sorted({min(s.width(), _max_icon_size) for s in icon.availableSizes()})
+        images = [(s, icon.pixmap(QSize(s, s)).toImage()) for s in sizes or [16, 32]]
+        images = [(s, image) for s, image in images if not image.isNull()]
+        if images:
+            QThreadPool.globalInstance().start(
+                _SaveTask(self._directory, url, images, self._signals))
+
+    def importIconFile(self, url, file_name):
+        """Stores an icon file (for example a bookmark icon of an older
+        version) unless there already is an icon for the page."""
+        if not self.hasIcon(url):
+            self.setIcon(url, QIcon(file_name))
+
+    def _saved(self, url, key, sizes):
+        index = self._loadedIndex()
+        index['icons'][key] = sizes
+        index['unreferenced'].pop(key, None)
+        page_key = _pageKey(url)
+        host = url.host().lower()
+        host_key = index['hosts'].get(host) if host else None
+        if host and (host_key is None or host_key == key
+                     or url.path() in ('', '/')):
+            # The start page of a host defines the icon of the host, pages
+            # showing it do not need an entry of their own
+            index['hosts'][host] = key
+            index['pages'].pop(page_key, None)
+            if host_key not in (None, key):
+                self._dropUnreferenced(host_key)
+        else:
+            index['pages'][page_key] = key
+        self._index_modified = True
+        self._write_timer.start()
+        self.icon_changed.emit(url)
+
+    def _dropUnreferenced(self, old_key):
+        index = self._index
+        if (old_key in index['hosts'].values()
+                or old_key in index['pages'].values()):
+            return
+        self._icons.pop(old_key, None)
+        sizes = index['icons'].pop(old_key, [])
+        if sizes:
+            index['unreferenced'][old_key] = sizes
+
+    def flush(self):
+        """Writes the index if it has changed."""
+        self._write_timer.stop()
+        if not self._index_modified:
+            return
+        self._index_modified = False
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            file_name = os.path.join(self._directory, _index_file)
+            with open(file_name + '.tmp', 'w') as f:
+                json.dump(self._index, f)
+            os.replace(file_name + '.tmp', file_name)
+        except OSError as e:
+            print(f'Cannot write the favicon index: {e}')
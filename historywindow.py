@@ -1,7 +1,9 @@
-from PySide6.QtWidgets import QApplication, QTreeView
+from PySide6.QtWidgets import QMenu, QTreeView
 
 from PySide6.QtCore import Signal, QAbstractTableModel, QModelIndex, Qt, QUrl
 
+from faviconstore import FaviconStore
+
 
 class HistoryModel(QAbstractTableModel):
 
@@ -28,6 +30,8 @@ class HistoryModel(QAbstractTableModel):
         column = index.column()
         if role == Qt.DisplayRole:
             return item.title() if column == 0 else item.url().toString()
+        if role == Qt.DecorationRole and column == 0:
+            return FaviconStore.instance().icon(item.url())
         return None
 
     def refresh(self):
@@ -38,6 +42,7 @@ class HistoryModel(QAbstractTableModel):
 class HistoryWindow(QTreeView):
 
     open_url = Signal(QUrl)
+    open_archived_url = Signal(QUrl)
 
     def __init__(self, history, parent):
         super().__init__(parent)
@@ -46,8 +51,8 @@ class HistoryWindow(QTreeView):
         self.setModel(self._model)
         self.activated.connect(self._activated)
 
-        screen = QApplication.desktop().screenGeometry(parent)
-        self.resize(screen.width() / 3, screen.height() / 3)
+        screen = parent.screen().availableGeometry()
+        self.resize(screen.width() // 3, screen.height() // 3)
         self._adjustSize()
 
     def refresh(self):
@@ -60,4 +65,14 @@ class HistoryWindow(QTreeView):
 
     def _activated(self, index):
         item = self._model.item_at(index)
-        self.open_url.emit(item.url())
\ No newline at end of file
+        self.open_url.emit(item.url())
+
+    def contextMenuEvent(self, event):
+        index = self.indexAt(event.pos())
+        if not index.isValid():
+            return
+        context_menu = QMenu()
+        open_archived_action = context_menu.addAction("Open Archived Copy")
+        chosen_action = context_menu.exec(event.globalPos())
+        if chosen_action == open_archived_action:
+            self.open_archived_url.emit(self._model.item_at(index).url())
\ No newline at end of file
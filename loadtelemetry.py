@@ -0,0 +1,226 @@
+import json
+import math
+import os
+import random
+import time
+from functools import partial
+
+from PySide6.QtCore import QObject, QTimer
+from PySide6.QtWebEngineCore import QWebEngineScript
+
+_export_interval = 60000
+
+# Histogram buckets grow by 5%, bounding the percentile error to 5%
+_bucket_growth = 1.05
+_log_bucket_growth = math.log(_bucket_growth)
+_quantiles = (0.5, 0.95, 0.99)
+
+# Navigation Timing and Paint Timing of the main frame, in ms relative
+# to the start of the navigation. Run in the application world so that
+# page scripts cannot interfere.
+_timing_script = """(function() {
+    var result = {};
+    var navigation = performance.getEntriesByType('navigation')[0];
+    if (navigation) {
+        result.ttfb = navigation.responseStart;
+        result.dom_interactive = navigation.domInteractive;
+        result.dom_content_loaded = navigation.domContentLoadedEventEnd;
+        result.load_event = navigation.loadEventEnd;
+    }
+    performance.getEntriesByType('paint').forEach(function(entry) {
+        result[entry.name.replace(/-/g, '_')] = entry.startTime;
+    });
+    return JSON.stringify(result);
+})()"""
+
+_telemetry = None
+
+
+def install(file_name, sample_rate=1.0, raw_samples=False):
+    """Enables collection; views created afterwards are attached."""
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = LoadTelemetry(file_name, sample_rate, raw_samples)
+    return _telemetry
+
+
+def attach(web_engine_view):
+    """Records the page loads of a view if collection is enabled."""
+    if _telemetry is not None:
+        _telemetry.attach(web_engine_view)
+
+
+def uninstall():
+    global _telemetry
+    if _telemetry is not None:
+        _telemetry.export()
+        _telemetry = None
+
+
+class _Histogram:
+    """Log bucketed histogram of positive values."""
+
+    def __init__(self):
+        self._buckets = {}  # map bucket index to count
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        index = int(math.log(max(value, 1.0)) / _log_bucket_growth)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return _bucket_growth ** (index + 1)
+        return 0.0
+
+
+# Measures the page loads of WebEngineViews: wall time from loadStarted
+# to the first loadProgress and to loadFinished, plus the Navigation and
+# Paint Timing of the page. Values are aggregated into histograms per
+# host and metric and exported as a Prometheus text file (.prom) or
+# appended as JSON lines, one summary per host and metric. The single
+# page loads are only appended to JSON lines if raw_samples is set.
+class LoadTelemetry(QObject):
+    """Collects page load timings per host."""
+
+    def __init__(self, file_name, sample_rate=1.0, raw_samples=False,
+                 parent=None):
+        super().__init__(parent)
+        self._file_name = file_name
+        self._prometheus = file_name.endswith('.prom')
+        self._sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self._raw_samples = raw_samples
+        self._loads = {}  # map WebEngineView to sampled load in progress
+        self._histograms = {}  # map (host, metric) to _Histogram
+        self._new_samples = []
+        self._timer = QTimer(self)
+        self._timer.setInterval(_export_interval)
+        self._timer.timeout.connect(self.export)
+        self._timer.start()
+
+    def attach(self, web_engine_view):
+        web_engine_view.loadStarted.connect(self._loadStarted)
+        web_engine_view.loadProgress.connect(self._loadProgress)
+        web_engine_view.loadFinished.connect(self._loadFinished)
+        # Views closed while loading never finish their load
+        web_engine_view.destroyed.connect(partial(self._loads.pop,
+                                                  web_engine_view, None))
+
+    def _loadStarted(self):
+        view = self.sender()
+        if random.random() >= self._sample_rate:
+            self._loads.pop(view, None)
+            return
+        self._loads[view] = {'start': time.monotonic(), 'first_progress': None}
+
+    def _loadProgress(self, progress):
+        load = self._loads.get(self.sender())
+        if load is not None and load['first_progress'] is None and progress > 0:
+            load['first_progress'] = time.monotonic()
+
+    def _loadFinished(self, ok):
+        view = self.sender()
+        load = self._loads.pop(view, None)
+        if load is None:
+            return
+        url = view.url()
+        # Query and fragment may carry personal data
+        url_string = url.toString().partition('#')[0].partition('?')[0]
+        sample = {'time': time.time(), 'host': url.host() or url.scheme(),
+                  'url': url_string, 'ok': ok,
+                  'load': (time.monotonic() - load['start']) * 1000}
+        if load['first_progress'] is not None:
+            sample['first_progress'] = (load['first_progress'] - load['start']) * 1000
+        if not ok:
+            self._record(sample)
+            return
+        view.page().runJavaScript(_timing_script,
+                                  QWebEngineScript.ApplicationWorld,
+                                  lambda result: self._timingReceived(sample, result))
+
+    def _timingReceived(self, sample, result):
+        try:
+            timing = json.loads(result) if result else {}
+        except (TypeError, ValueError):
+            timing = {}
+        for metric, value in timing.items():
+            if isinstance(value, (int, float)) and value > 0:
+                sample[metric] = value
+        self._record(sample)
+
+    def _record(self, sample):
+        self._new_samples.append(sample)
+        if not sample['ok']:
+            return
+        host = sample['host']
+        for metric, value in sample.items():
+            if metric in ('time', 'host', 'url', 'ok'):
+                continue
+            histogram = self._histograms.get((host, metric))
+            if histogram is None:
+                histogram = _Histogram()
+                self._histograms[(host, metric)] = histogram
+            histogram.add(value)
+
+    def percentiles(self, host, metric):
+        """Returns p50, p95 and p99 of a metric of a host in ms."""
+        histogram = self._histograms.get((host, metric))
+        if histogram is None:
+            return None
+        return tuple(histogram.percentile(q) for q in _quantiles)
+
+    def export(self):
+        try:
+            if self._prometheus:
+                self._writePrometheus()
+            else:
+                self._appendJsonLines()
+        except OSError as e:
+            print(f'Cannot write {self._file_name}: {e}')
+
+    # Appends the summaries since process start, if there were new loads
+    def _appendJsonLines(self):
+        samples = self._new_samples
+        self._new_samples = []
+        if not samples:
+            return
+        now = time.time()
+        with open(self._file_name, 'a') as f:
+            for (host, metric), histogram in sorted(self._histograms.items()):
+                summary = {'type': 'summary', 'time': now, 'host': host,
+                           'metric': metric, 'count': histogram.count,
+                           'sum': round(histogram.sum, 1)}
+                for q in _quantiles:
+                    summary[f'p{round(q * 100)}'] = round(histogram.percentile(q), 1)
+                f.write(json.dumps(summary) + '\n')
+            if self._raw_samples:
+                for sample in samples:
+                    f.write(json.dumps(dict(sample, type='sample')) + '\n')
+
+    def _writePrometheus(self):
+        self._new_samples = []
+        name = 'broda_page_load_milliseconds'
+        lines = [f'# HELP {name} Page load timings per host.',
+                 f'# TYPE {name} summary']
+        for (host, metric), histogram in sorted(self._histograms.items()):
+            labels = f'host="{_escape(host)}",metric="{metric}"'
+            for q in _quantiles:
+                value = histogram.percentile(q)
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {value:.1f}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.1f}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        temp_name = self._file_name + '.tmp'
+        with open(temp_name, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_name, self._file_name)
+
+
+def _escape(label_value):
+    return label_value.replace('\\', '\\\\').replace('"', '\\"')
@@ -1,23 +1,52 @@
+import math
 import sys
-from bookmarkwidget import BookmarkWidget
+import datascheme
+import loadtelemetry
+import newtabpage
+import speculation
+import stallwatchdog
+import startuptrace
+from functools import partial
+from automationserver import AutomationServer
+from bookmarkwidget import BookmarkWidget, configDir
 from browsertabwidget import BrowserTabWidget
 from downloadwidget import DownloadWidget
+from faviconstore import FaviconStore
 from findtoolbar import FindToolBar
+from netscapebookmarks import NetscapeBookmarkImporter, exportBookmarks
+from pagearchive import PageArchiver
+from sessionstore import SessionStore
+from singleinstance import SingleInstance
+from stallwatchdog import timedSlot
+from tabswitcher import TabSwitcher
+from taskmanager import TaskManagerWindow
 from webengineview import WebEngineView
 from PySide6 import QtCore
-from PySide6.QtCore import Qt, QUrl
+from PySide6.QtCore import (QCommandLineOption, QCommandLineParser, QDir,
+                            QFileInfo, Qt, QTimer, QUrl)
 from PySide6.QtGui import QAction, QKeySequence, QIcon
-from PySide6.QtWidgets import (QApplication, QDockWidget, QLabel,
-                               QLineEdit, QMainWindow, QToolBar)
-from PySide6.QtWebEngineCore import QWebEngineDownloadRequest, QWebEnginePage
+from PySide6.QtWidgets import (QApplication, QDockWidget, QFileDialog, QLabel,
+                               QLineEdit, QMainWindow, QMessageBox,
+                               QProgressDialog, QToolBar)
+from PySide6.QtWebEngineCore import (QWebEngineDownloadRequest, QWebEnginePage,
+                                     QWebEngineProfile)
+
+startuptrace.mark('imports')
+
+# Bookmarks shown on the new tab page
+_recent_bookmark_count = 8
 
 main_windows = []
+session_store = None
+task_manager_window = None
 
 
-def createMainWindow():
+def createMainWindow(session_id=None):
     """Creates a MainWindow using 75% of the available screen resolution."""
     main_win = MainWindow()
     main_windows.append(main_win)
+    if session_store is not None:
+        session_store.addWindow(main_win, session_id)
     available_geometry = main_win.screen().availableGeometry()
     main_win.resize(available_geometry.width() * 3 / 4,
                     available_geometry.height() * 3 / 4)
@@ -36,6 +65,8 @@ class MainWindow(QMainWindow):
     BrowserTabWidget, and a DownloadWidget, to offer the complete
     web browsing experience."""
 
+    session_changed = QtCore.Signal()
+
     def __init__(self):
         super().__init__()
 
@@ -44,19 +75,24 @@ class MainWindow(QMainWindow):
         self._tab_widget = BrowserTabWidget(createMainWindowWithBrowser)
         self._tab_widget.enabled_changed.connect(self._enabledChanged)
         self._tab_widget.download_requested.connect(self._downloadRequested)
+        self._tab_widget.session_changed.connect(self.session_changed)
+        self._tab_widget.detach_requested.connect(self._detachTab)
+        # Queued since the last tab may be dragged away from within a
+        # drag & drop operation started by this window
+        self._tab_widget.last_tab_removed.connect(self.close,
+                                                  Qt.QueuedConnection)
         self.setCentralWidget(self._tab_widget)
         self.connect(self._tab_widget, QtCore.SIGNAL("url_changed(QUrl)"),
                      self.urlChanged)
 
-        self._bookmark_dock = QDockWidget()
-        self._bookmark_dock.setWindowTitle('Bookmarks')
-        self._bookmark_widget = BookmarkWidget()
-        self._bookmark_widget.open_bookmark.connect(self.loadUrl)
-        self._bookmark_widget.open_bookmark_in_new_tab.connect(self.loadUrlInNewTab)
-        self._bookmark_dock.setWidget(self._bookmark_widget)
-        self.addDockWidget(Qt.LeftDockWidgetArea, self._bookmark_dock)
+        # The bookmarks are not needed to show the first page, they are
+        # created once the event loop runs (see _initDeferred())
+        self._bookmark_dock = None
+        self._bookmark_widget = None
+        self._bookmarksToolBar = None
 
         self._find_tool_bar = None
+        self._archive_progress_connected = False
 
         self._actions = {}
         self._createMenu()
@@ -70,23 +106,56 @@ class MainWindow(QMainWindow):
         self._addres_line_edit = QLineEdit()
         self._addres_line_edit.setClearButtonEnabled(True)
         self._addres_line_edit.returnPressed.connect(self.load)
+        self._addres_line_edit.textEdited.connect(speculation.typed)
         self._tool_bar.addWidget(self._addres_line_edit)
         self._zoom_label = QLabel()
         self.statusBar().addPermanentWidget(self._zoom_label)
         self._updateZoomLabel()
 
-        self._bookmarksToolBar = QToolBar()
-        self.addToolBar(Qt.TopToolBarArea, self._bookmarksToolBar)
-        self.insertToolBarBreak(self._bookmarksToolBar)
-        self._bookmark_widget.changed.connect(self._updateBookmarks)
-        self._updateBookmarks()
-
+        QTimer.singleShot(0, self._initDeferred)
+
+    @timedSlot
+    def _initDeferred(self):
+        self._bookmarkWidget()
+        startuptrace.mark('deferred ui')
+
+    # Create the bookmark dock, tool bar and menu entries on first use
+    def _bookmarkWidget(self):
+        if self._bookmark_widget is None:
+            self._bookmark_dock = QDockWidget()
+            self._bookmark_dock.setWindowTitle('Bookmarks')
+            self._bookmark_widget = BookmarkWidget()
+            self._bookmark_widget.open_bookmark.connect(self.loadUrl)
+            self._bookmark_widget.open_bookmark_in_new_tab.connect(self.loadUrlInNewTab)
+            self._bookmark_widget.open_archived_bookmark.connect(
+                self._tab_widget.loadArchivedCopy)
+            self._bookmark_widget.bookmark_hovered.connect(speculation.hovered)
+            self._bookmark_dock.setWidget(self._bookmark_widget)
+            self.addDockWidget(Qt.LeftDockWidgetArea, self._bookmark_dock)
+            self._window_menu.insertAction(self._window_menu_separator,
+                                           self._bookmark_dock.toggleViewAction())
+
+            self._bookmarksToolBar = QToolBar()
+            self.addToolBar(Qt.TopToolBarArea, self._bookmarksToolBar)
+            self.insertToolBarBreak(self._bookmarksToolBar)
+            self._bookmark_widget.changed.connect(self._updateBookmarks)
+            self._updateBookmarks()
+        return self._bookmark_widget
+
+    @timedSlot
     def _updateBookmarks(self):
         self._bookmark_widget.populateToolbar(self._bookmarksToolBar)
-        self._bookmark_widget.populateOther(self._bookmark_menu, 3)
+        self._bookmark_widget.populateOther(self._bookmark_menu,
+                                            self._bookmark_menu_first_action)
+        newtabpage.NewTabPage.instance().setRecentBookmarks(
+            self._bookmark_widget.recentBookmarks(_recent_bookmark_count))
 
     def _createMenu(self):
         file_menu = self.menuBar().addMenu("&File")
+        save_offline_action = QAction("Save Page for Offline", self,
+                                      triggered=self._tab_widget.savePageForOffline)
+        file_menu.addAction(save_offline_action)
+        file_menu.addSeparator()
         exit_action = QAction(QIcon.fromTheme("application-exit"), "E&xit",
                               self, shortcut="Ctrl+Q", triggered=app.quit)
         file_menu.addAction(exit_action)
@@ -123,7 +192,7 @@ class MainWindow(QMainWindow):
 
         new_tab_action = QAction("New Tab", self,
                                  shortcut='Ctrl+T',
-                                 triggered=self.addBrowserTab)
+                                 triggered=self.addNewTab)
         navigation_menu.addAction(new_tab_action)
 
         close_tab_action = QAction("Close Current Tab", self,
@@ -131,6 +200,11 @@ class MainWindow(QMainWindow):
                                    triggered=self._closeCurrentTab)
         navigation_menu.addAction(close_tab_action)
 
+        switch_tab_action = QAction("Switch Tab...", self,
+                                    shortcut="Ctrl+Tab",
+                                    triggered=self._showTabSwitcher)
+        navigation_menu.addAction(switch_tab_action)
+
         navigation_menu.addSeparator()
 
         history_action = QAction("History...", self,
@@ -192,24 +266,31 @@ class MainWindow(QMainWindow):
         edit_menu.addAction(select_all_action)
 
         self._bookmark_menu = self.menuBar().addMenu("&Bookmarks")
+        self._bookmark_menu.aboutToShow.connect(self._bookmarkWidget)
         add_bookmark_action = QAction("&Add Bookmark", self,
                                       triggered=self._addBookmark)
         self._bookmark_menu.addAction(add_bookmark_action)
         add_tool_bar_bookmark_action = QAction("&Add Bookmark to Tool Bar", self,
                                                triggered=self._addToolbarBookmark)
         self._bookmark_menu.addAction(add_tool_bar_bookmark_action)
+        archive_bookmarks_action = QAction("Archive All Bookmarks", self,
+                                           triggered=self._archiveBookmarks)
+        self._bookmark_menu.addAction(archive_bookmarks_action)
+        import_bookmarks_action = QAction("&Import Bookmarks...", self,
+                                          triggered=self._importBookmarks)
+        self._bookmark_menu.addAction(import_bookmarks_action)
+        export_bookmarks_action = QAction("&Export Bookmarks...", self,
+                                          triggered=self._exportBookmarks)
+        self._bookmark_menu.addAction(export_bookmarks_action)
         self._bookmark_menu.addSeparator()
+        self._bookmark_menu_first_action = len(self._bookmark_menu.actions())
 
-        tools_menu = self.menuBar().addMenu("&Tools")
-        download_action = QAction("Open Downloads", self,
-                                  triggered=DownloadWidget.openDownloadDirectory)
-        tools_menu.addAction(download_action)
+        self._tools_menu = self.menuBar().addMenu("&Tools")
+        self._tools_menu.aboutToShow.connect(self._populateToolsMenu)
 
         window_menu = self.menuBar().addMenu("&Window")
-
-        window_menu.addAction(self._bookmark_dock.toggleViewAction())
-
-        window_menu.addSeparator()
+        self._window_menu = window_menu
+        self._window_menu_separator = window_menu.addSeparator()
 
         zoom_in_action = QAction(QIcon.fromTheme("zoom-in"),
                                  "Zoom In", self,
@@ -234,9 +315,48 @@ class MainWindow(QMainWindow):
                                triggered=app.aboutQt)
         about_menu.addAction(about_action)
 
+    def _populateToolsMenu(self):
+        if not self._tools_menu.isEmpty():
+            return
+        download_action = QAction("Open Downloads", self,
+                                  triggered=DownloadWidget.openDownloadDirectory)
+        self._tools_menu.addAction(download_action)
+        task_manager_action = QAction("Task Manager", self,
+                                      shortcut="Shift+Esc",
+                                      triggered=_showTaskManager)
+        self._tools_menu.addAction(task_manager_action)
+
+    @timedSlot
     def addBrowserTab(self):
         return self._tab_widget.addBrowserTab()
 
+    @timedSlot
+    def addNewTab(self):
+        """Adds a tab showing the new tab page."""
+        view = self.addBrowserTab()
+        view.load(newtabpage.newTabUrl())
+        self._addres_line_edit.setFocus()
+        return view
+
+    def tabWidget(self):
+        return self._tab_widget
+
+    def sessionChanges(self, all_tabs=False):
+        return self._tab_widget.sessionChanges(all_tabs)
+
+    def restoreSessionState(self, state):
+        self._tab_widget.restoreSessionState(state)
+
+    @timedSlot
+    def _detachTab(self, index, pos):
+        """Moves the tab at index into a new window (at pos if given)
+        without reloading it."""
+        web_engine_view = self._tab_widget.takeBrowserTab(index)
+        main_win = createMainWindow()
+        main_win.tabWidget().insertBrowserTab(web_engine_view)
+        if not pos.isNull():
+            main_win.move(pos)
+
     def _closeCurrentTab(self):
         if self._tab_widget.count() > 1:
             self._tab_widget.closeCurrentTab()
@@ -245,8 +365,13 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         main_windows.remove(self)
+        # Closing the last window ends the application, keep its tabs
+        # for the next session
+        if session_store is not None and main_windows:
+            session_store.removeWindow(self)
         event.accept()
 
+    @timedSlot
     def load(self):
         url_string = self._addres_line_edit.text().strip()
         if url_string:
@@ -257,15 +382,24 @@ class MainWindow(QMainWindow):
         if (url.isValid()):
             self.loadUrl(url)
 
+    @timedSlot
     def loadUrl(self, url):
         self._tab_widget.load(url)
 
+    @timedSlot
     def loadUrlInNewTab(self, url):
-        self.addBrowserTab().load(url)
+        view = self.addBrowserTab()
+        view.load(url)
+        return view
 
+    @timedSlot
     def urlChanged(self, url):
-        self._addres_line_edit.setText(url.toString())
+        if newtabpage.isNewTabUrl(url):
+            self._addres_line_edit.clear()
+        else:
+            self._addres_line_edit.setText(url.toString())
 
+    @timedSlot
     def _enabledChanged(self, web_action, enabled):
         action = self._actions[web_action]
         if action:
@@ -277,7 +411,7 @@ class MainWindow(QMainWindow):
             url = self._tab_widget.url()
             title = self._tab_widget.tabText(index)
             icon = self._tab_widget.tabIcon(index)
-            self._bookmark_widget.add_bookmark(url, title, icon)
+            self._bookmarkWidget().addBookmark(url, title, icon)
 
     def _addToolbarBookmark(self):
         index = self._tab_widget.currentIndex()
@@ -285,20 +419,23 @@ class MainWindow(QMainWindow):
             url = self._tab_widget.url()
             title = self._tab_widget.tabText(index)
             icon = self._tab_widget.tabIcon(index)
-            self._bookmark_widget.add_tool_bar_bookmark(url, title, icon)
+            self._bookmarkWidget().addToolbarBookmark(url, title, icon)
 
+    @timedSlot
     def _zoomIn(self):
         new_zoom = self._tab_widget.zoomFactor() * 1.5
         if (new_zoom <= WebEngineView.maximumZoomFactor()):
             self._tab_widget.setZoomFactor(new_zoom)
             self._updateZoomLabel()
 
+    @timedSlot
     def _zoomOut(self):
         new_zoom = self._tab_widget.zoomFactor() / 1.5
         if (new_zoom >= WebEngineView.minimumZoomFactor()):
             self._tab_widget.setZoomFactor(new_zoom)
             self._updateZoomLabel()
 
+    @timedSlot
     def _resetZoom(self):
         self._tab_widget.setZoomFactor(1)
         self._updateZoomLabel()
@@ -307,7 +444,73 @@ class MainWindow(QMainWindow):
         percent = int(self._tab_widget.zoomFactor() * 100)
         self._zoom_label.setText(f"{percent}%")
 
+    @timedSlot
+    def _archiveBookmarks(self):
+        archiver = PageArchiver.instance()
+        if not self._archive_progress_connected:
+            archiver.progress.connect(self._archiveProgress)
+            self._archive_progress_connected = True
+        rejected = archiver.archiveUrls(self._bookmarkWidget().urls())
+        if rejected:
+            self.statusBar().showMessage(
+                f'Archive queue full, skipped {rejected} bookmarks', 5000)
+
+    def _archiveProgress(self, done, total):
+        self.statusBar().showMessage(f'Archived {done} of {total} pages', 5000)
+
+    @timedSlot
+    def _importBookmarks(self):
+        file_name, _ = QFileDialog.getOpenFileName(
+            self, 'Import Bookmarks', QDir.homePath(),
+            'Bookmark files (*.html *.htm);;All files (*)')
+        if not file_name:
+            return
+        bookmark_widget = self._bookmarkWidget()
+        folder_title = f'Imported from {QFileInfo(file_name).fileName()}'
+        importer = NetscapeBookmarkImporter(file_name, bookmark_widget.urls(),
+                                            folder_title, self)
+        progress_dialog = QProgressDialog('Importing bookmarks...', 'Cancel',
+                                          0, 100, self)
+        progress_dialog.setMinimumDuration(500)
+        progress_dialog.setAutoReset(False)
+        progress_dialog.canceled.connect(importer.cancel)
+        progress_dialog.canceled.connect(importer.deleteLater)
+        progress_dialog.canceled.connect(progress_dialog.deleteLater)
+        importer.progress.connect(
+            lambda done, total: progress_dialog.setValue(100 * done // max(total, 1)))
+        importer.finished.connect(partial(self._bookmarksImported, progress_dialog))
+        importer.finished.connect(importer.deleteLater)
+        importer.failed.connect(progress_dialog.deleteLater)
+        importer.failed.connect(importer.deleteLater)
+        importer.failed.connect(partial(QMessageBox.warning, self, 'Import Bookmarks'))
+        importer.start()
+
+    def _bookmarksImported(self, progress_dialog, folder_item, count,
+                           duplicate_count):
+        progress_dialog.close()
+        progress_dialog.deleteLater()
+        self._bookmarkWidget().addFolder(folder_item)
+        self.statusBar().showMessage(f'Imported {count} bookmarks, skipped '
+                                     f'{duplicate_count} duplicates', 5000)
+
+    @timedSlot
+    def _exportBookmarks(self):
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, 'Export Bookmarks', QDir.homePath() + '/bookmarks.html',
+            'Bookmark files (*.html *.htm)')
+        if not file_name:
+            return
+        try:
+            exportBookmarks(self._bookmarkWidget().model(), file_name)
+        except OSError as e:
+            QMessageBox.warning(self, 'Export Bookmarks',
+                                f'Cannot write {file_name}: {e.strerror}')
+
+    @timedSlot
     def _downloadRequested(self, item):
+        # Page saves for the offline archive are handled by PageArchiver
+        if PageArchiver.instance().isArchiveDownload(item):
+            return
         # Remove old downloads before opening a new one
         for old_download in self.statusBar().children():
             if (type(old_download).__name__ == 'DownloadWidget' and
@@ -321,11 +524,20 @@ class MainWindow(QMainWindow):
                                                  Qt.QueuedConnection)
         self.statusBar().addWidget(download_widget)
 
+    @timedSlot
     def _removeDownloadRequested(self):
             download_widget = self.sender()
             self.statusBar().removeWidget(download_widget)
             del download_widget
 
+    def _showTabSwitcher(self):
+        self._tab_widget.captureCurrentTab()
+        tab_switcher = TabSwitcher(self._tab_widget, self)
+        available_geometry = self.screen().availableGeometry()
+        tab_switcher.resize(available_geometry.width() / 2,
+                            available_geometry.height() / 2)
+        tab_switcher.exec()
+
     def _showFind(self):
         if self._find_tool_bar is None:
             self._find_tool_bar = FindToolBar()
@@ -335,18 +547,203 @@ class MainWindow(QMainWindow):
             self._find_tool_bar.show()
         self._find_tool_bar.focusFind()
 
+    @timedSlot
     def writeBookmarks(self):
-        self._bookmark_widget.writeBookmarks()
+        if self._bookmark_widget is not None:
+            self._bookmark_widget.writeBookmarks()
+
+
+def _tabWidgets():
+    return [w.tabWidget() for w in main_windows]
+
+
+def _showTaskManager():
+    global task_manager_window
+    if task_manager_window is None:
+        task_manager_window = TaskManagerWindow(_tabWidgets)
+        task_manager_window.resize(640, 320)
+    task_manager_window.show()
+    task_manager_window.raise_()
+
+
+def _openForwardedUrls(urls):
+    """Opens URLs handed over by another invocation in the most recently
+    active window, or a new window if none were given."""
+    if not urls or not main_windows:
+        main_win = createMainWindow()
+    elif QApplication.activeWindow() in main_windows:
+        main_win = QApplication.activeWindow()
+    else:
+        main_win = main_windows[-1]
+    if not urls:
+        main_win.addNewTab()
+    for url in urls:
+        main_win.loadUrlInNewTab(QUrl(url))
+    main_win.raise_()
+    main_win.activateWindow()
+
+
+def _traceFirstLoad(view, dump_trace):
+    def loadStarted():
+        view.loadStarted.disconnect(loadStarted)
+        startuptrace.mark('first load started')
+
+    def loadFinished():
+        view.loadFinished.disconnect(loadFinished)
+        startuptrace.mark('first load finished')
+        if dump_trace:
+            startuptrace.dump()
+
+    view.loadStarted.connect(loadStarted)
+    view.loadFinished.connect(loadFinished)
 
 
 if __name__ == '__main__':
+    # Custom schemes need to be known before the application is created
+    datascheme.registerScheme()
+    newtabpage.registerScheme()
     app = QApplication(sys.argv)
-    main_win = createMainWindow()
-    initial_urls = sys.argv[1:]
-    if not initial_urls:
+    startuptrace.mark('application')
+    parser = QCommandLineParser()
+    parser.addHelpOption()
+    parser.addPositionalArgument('urls', 'URLs to open.', '[urls...]')
+    automation_option = QCommandLineOption(
+        ['automation-server'],
+        'Listen for JSON-RPC automation requests on the local socket <name>.',
+        'name')
+    parser.addOption(automation_option)
+    new_instance_option = QCommandLineOption(
+        ['new-instance'],
+        'Start an independent instance instead of handing the URLs '
+        'to a running one.')
+    parser.addOption(new_instance_option)
+    startup_trace_option = QCommandLineOption(
+        ['startup-trace'],
+        'Print the time spent in each startup phase once the first page '
+        'has loaded.')
+    parser.addOption(startup_trace_option)
+    watchdog_option = QCommandLineOption(
+        ['watchdog'],
+        'Report event loop stalls longer than 200 ms and the latency '
+        'histogram to <file>.',
+        'file')
+    parser.addOption(watchdog_option)
+    load_telemetry_option = QCommandLineOption(
+        ['load-telemetry'],
+        'Record page load timings per host to <file>, as Prometheus text '
+        'if it ends with .prom, as JSON lines of p50/p95/p99 summaries '
+        'otherwise.',
+        'file')
+    parser.addOption(load_telemetry_option)
+    load_telemetry_sample_option = QCommandLineOption(
+        ['load-telemetry-sample-rate'],
+        'Fraction of the page loads to record (default 1).',
+        'rate', '1')
+    parser.addOption(load_telemetry_sample_option)
+    load_telemetry_raw_option = QCommandLineOption(
+        ['load-telemetry-samples'],
+        'Also append the single page loads (without query strings) when '
+        'writing JSON lines.')
+    parser.addOption(load_telemetry_raw_option)
+    data_root_option = QCommandLineOption(
+        ['data-root'],
+        'Serve the files below <directory> as broda-data://<name>/. '
+        'Can be given several times.',
+        'name=directory')
+    parser.addOption(data_root_option)
+    no_session_option = QCommandLineOption(
+        ['no-session'],
+        'Neither restore nor save the open tabs.')
+    parser.addOption(no_session_option)
+    no_speculation_option = QCommandLineOption(
+        ['no-speculation'],
+        'Do not preconnect to the origins of hovered bookmarks and '
+        'predicted address bar input.')
+    parser.addOption(no_speculation_option)
+    parser.process(app)
+    sample_rate = 1.0
+    if parser.isSet(load_telemetry_option):
+        try:
+            sample_rate = float(parser.value(load_telemetry_sample_option))
+        except ValueError:
+            sample_rate = math.nan
+        if math.isnan(sample_rate):
+            print(f'Invalid sample rate "{parser.value(load_telemetry_sample_option)}".')
+            sys.exit(1)
+        sample_rate = min(max(sample_rate, 0.0), 1.0)
+    data_roots = None
+    if parser.isSet(data_root_option):
+        try:
+            data_roots = datascheme.parseRoots(parser.values(data_root_option))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    # Resolve relative file names against this process' working directory
+    initial_urls = [QUrl.fromUserInput(u, QDir.currentPath()).toString()
+                    for u in parser.positionalArguments()]
+    single_instance = None
+    if not parser.isSet(new_instance_option):
+        single_instance = SingleInstance(app)
+        if single_instance.forwardOrListen(initial_urls):
+            sys.exit(0)
+        if single_instance.isListening():
+            single_instance.urls_received.connect(_openForwardedUrls)
+            # An independent instance would compete for the session files
+            if not parser.isSet(no_session_option):
+                session_store = SessionStore(configDir(), app)
+        else:
+            print('Cannot reach or become the primary instance, starting '
+                  'an independent instance without session.')
+    # Accessing the default profile starts up Qt WebEngine, which an
+    # invocation that only hands over its URLs must not wait for
+    profile = QWebEngineProfile.defaultProfile()
+    newtabpage.NewTabPage.instance().install(profile)
+    data_scheme_handler = None
+    if data_roots is not None:
+        data_scheme_handler = datascheme.DataSchemeHandler(data_roots, app)
+        data_scheme_handler.install(profile)
+    if parser.isSet(watchdog_option):
+        stallwatchdog.install(parser.value(watchdog_option))
+    if parser.isSet(load_telemetry_option):
+        loadtelemetry.install(parser.value(load_telemetry_option), sample_rate,
+                              parser.isSet(load_telemetry_raw_option))
+    if not parser.isSet(no_speculation_option):
+        speculation.install()
+    restored_windows = []
+    if session_store is not None:
+        for session_id, state in session_store.restoredWindows():
+            restored_window = createMainWindow(session_id)
+            restored_window.restoreSessionState(state)
+            if restored_window.tabWidget().count() == 0:
+                restored_window.addNewTab()
+            restored_windows.append(restored_window)
+        startuptrace.mark('session restored')
+    main_win = restored_windows[0] if restored_windows else createMainWindow()
+    startuptrace.mark('window')
+    automation_server = None
+    if parser.isSet(automation_option):
+        automation_server = AutomationServer(_tabWidgets, app)
+        automation_server.listen(parser.value(automation_option))
+    if not initial_urls and main_win.tabWidget().count() == 0:
         initial_urls.append('http://qt.io')
-    for url in initial_urls:
-        main_win.loadUrlInNewTab(QUrl.fromUserInput(url))
+    # Start loading the first page right away, the other tabs are
+    # opened once the event loop runs
+    if initial_urls:
+        first_view = main_win.loadUrlInNewTab(QUrl(initial_urls[0]))
+    else:
+        first_view = main_win.tabWidget().currentWidget()
+    _traceFirstLoad(first_view, parser.isSet(startup_trace_option))
+    startuptrace.mark('first tab')
+    for url in initial_urls[1:]:
+        QTimer.singleShot(0, partial(main_win.loadUrlInNewTab, QUrl(url)))
     exit_code = app.exec()
+    # Without an event loop the heartbeat stops, stop watching first
+    stallwatchdog.uninstall()
     main_win.writeBookmarks()
+    FaviconStore.instance().flush()
+    newtabpage.NewTabPage.instance().flush()
+    if session_store is not None:
+        session_store.close()
+    loadtelemetry.uninstall()
+    speculation.uninstall()
     sys.exit(exit_code)
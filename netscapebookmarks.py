@@ -0,0 +1,185 @@
+import codecs
+import html
+import os
+from html.parser import HTMLParser
+
+from bookmarkwidget import _createFolderItem, _createItem, _url_role
+from PySide6 import QtCore
+from PySide6.QtCore import QObject, QTimer, QUrl
+
+# Bytes parsed per event loop iteration
+_chunk_size = 64 * 1024
+
+_supported_schemes = ('http', 'https', 'ftp', 'file')
+_default_ports = {'http': 80, 'https': 443, 'ftp': 21}
+
+
+def normalizedUrl(url):
+    """Returns a string identifying a URL regardless of the case of scheme
+    and host, default ports, an empty path and the fragment."""
+    scheme = url.scheme().lower()
+    result = f'{scheme}://{url.host().lower()}'
+    port = url.port()
+    if port != -1 and port != _default_ports.get(scheme):
+        result += f':{port}'
+    result += url.path() or '/'
+    if url.hasQuery():
+        result += '?' + url.query()
+    return result
+
+
+# Builds a detached item tree from the <DL>/<DT> structure of a Netscape
+# bookmark file. Netscape files do not close <DT> and <p>, so only <A>,
+# <H3> and <DL> are looked at. New items are collected per folder and
+# appended in one appendRows() per folder and batch.
+class _NetscapeParser(HTMLParser):
+
+    def __init__(self, root_item, existing_urls):
+        super().__init__(convert_charrefs=True)
+        self._folders = [root_item]
+        self._dl_opens_folder = []
+        self._next_folder = None
+        self._text = None
+        self._href = None
+        self._pending = {}  # map id of folder item to (item, new children)
+        self._urls = {normalizedUrl(url) for url in existing_urls}
+        self.count = 0
+        self.duplicate_count = 0
+
+    def _append(self, item):
+        parent = self._folders[-1]
+        self._pending.setdefault(id(parent), (parent, []))[1].append(item)
+
+    def flush(self):
+        for parent, children in self._pending.values():
+            parent.appendRows(children)
+        self._pending = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._href = dict(attrs).get('href')
+            self._text = []
+        elif tag == 'h3':
+            self._text = []
+        elif tag == 'dl':
+            opens_folder = self._next_folder is not None
+            if opens_folder:
+                self._folders.append(self._next_folder)
+                self._next_folder = None
+            self._dl_opens_folder.append(opens_folder)
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._text is not None:
+            title = ''.join(self._text).strip()
+            self._text = None
+            url = QUrl(self._href or '')
+            self._href = None
+            if not url.isValid() or url.scheme().lower() not in _supported_schemes:
+                return
+            key = normalizedUrl(url)
+            if key in self._urls:
+                self.duplicate_count += 1
+                return
+            self._urls.add(key)
+            self._append(_createItem(url, title or url.toString()))
+            self.count += 1
+        elif tag == 'h3' and self._text is not None:
+            folder_item = _createFolderItem(''.join(self._text).strip())
+            self._text = None
+            self._append(folder_item)
+            self._next_folder = folder_item
+        elif tag == 'dl' and self._dl_opens_folder:
+            if self._dl_opens_folder.pop():
+                self._folders.pop()
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+
+# Imports a Netscape bookmark file (bookmarks.html as exported by most
+# browsers) in chunks from a timer, so that the event loop keeps running
+# during a large import. The bookmarks are inserted into a folder item
+# that is not part of a model yet; it is handed over by finished() to be
+# added to the model with a single row insertion.
+class NetscapeBookmarkImporter(QObject):
+    """Imports bookmarks from a Netscape bookmark file incrementally."""
+
+    progress = QtCore.Signal(int, int)
+    finished = QtCore.Signal(object, int, int)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, file_name, existing_urls, folder_title, parent=None):
+        super().__init__(parent)
+        self._file_name = file_name
+        self._folder_item = _createFolderItem(folder_title)
+        self._parser = _NetscapeParser(self._folder_item, existing_urls)
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._file = None
+        self._size = 0
+        self._read = 0
+        self._timer = QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._parseChunk)
+
+    def start(self):
+        try:
+            self._file = open(self._file_name, 'rb')
+            self._size = os.fstat(self._file.fileno()).st_size
+        except OSError as e:
+            self.failed.emit(f'Cannot open {self._file_name}: {e.strerror}')
+            return
+        self._timer.start()
+
+    def cancel(self):
+        self._timer.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _parseChunk(self):
+        try:
+            data = self._file.read(_chunk_size)
+        except OSError as e:
+            self.cancel()
+            self.failed.emit(f'Cannot read {self._file_name}: {e.strerror}')
+            return
+        self._read += len(data)
+        last = not data
+        self._parser.feed(self._decoder.decode(data, final=last))
+        if last:
+            self._parser.close()
+        self._parser.flush()
+        self.progress.emit(self._read, self._size)
+        if last:
+            self.cancel()
+            self.finished.emit(self._folder_item, self._parser.count,
+                               self._parser.duplicate_count)
+
+
+def _writeFolder(f, folder_item, depth, tool_bar=False):
+    indent = '    ' * depth
+    attributes = ' PERSONAL_TOOLBAR_FOLDER="true"' if tool_bar else ''
+    f.write(f'{indent}<DT><H3{attributes}>{html.escape(folder_item.text())}</H3>\n')
+    f.write(f'{indent}<DL><p>\n')
+    for r in range(0, folder_item.rowCount()):
+        item = folder_item.child(r)
+        url = item.data(_url_role)
+        if url is None:
+            _writeFolder(f, item, depth + 1)
+        else:
+            f.write(f'{indent}    <DT><A HREF="{html.escape(url.toString())}">'
+                    f'{html.escape(item.text())}</A>\n')
+    f.write(f'{indent}</DL><p>\n')
+
+
+def exportBookmarks(model, file_name):
+    """Writes the bookmarks of a model in Netscape format, the first top
+    level folder being the tool bar."""
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE NETSCAPE-Bookmark-file-1>\n'
+                '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+                '<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n<DL><p>\n')
+        for row in range(0, model.rowCount()):
+            _writeFolder(f, model.item(row), 1, tool_bar=(row == 0))
+        f.write('</DL><p>\n')
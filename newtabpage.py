@@ -0,0 +1,383 @@
+import base64
+import bisect
+import heapq
+import html
+import json
+import math
+import os
+import time
+
+import bookmarkwidget
+from faviconstore import FaviconStore
+from PySide6 import QtCore
+from PySide6.QtCore import (QBuffer, QByteArray, QIODevice, QObject,
+                            QRunnable, QThreadPool, QTimer, QUrl)
+from PySide6.QtWebEngineCore import (QWebEngineUrlRequestJob, QWebEngineUrlScheme,
+                                     QWebEngineUrlSchemeHandler)
+
+_scheme = b'broda'
+_new_tab_host = 'newtab'
+
+# Visits lose half of their weight in two weeks
+_half_life = 14 * 24 * 3600
+_decay = math.log(2) / _half_life
+
+# Factor by which the best match of typed text has to outrank the
+# second best one to count as a confident prediction
+_confidence_margin = math.log(3)
+
+_top_site_count = 8
+_max_entries = 5000
+_frecency_file = 'frecency.json'
+_write_delay = 5000
+
+_style = """
+body { font-family: sans-serif; margin: 40px auto; max-width: 880px;
+       background: #f4f4f4; color: #202020; }
+h2 { font-size: 14px; font-weight: normal; color: #606060; margin: 24px 8px 8px; }
+.tiles { display: flex; flex-wrap: wrap; }
+.tiles a { display: block; width: 184px; margin: 8px; padding: 12px;
+           background: white; border-radius: 8px; color: inherit;
+           text-decoration: none; overflow: hidden; white-space: nowrap;
+           text-overflow: ellipsis; box-shadow: 0 1px 3px rgba(0, 0, 0, 0.2); }
+.tiles a:hover { background: #e8f0fe; }
+.tiles img { width: 16px; height: 16px; vertical-align: middle; margin-right: 6px; }
+.host { display: block; font-size: 12px; color: #808080; margin-top: 4px; }
+@media (prefers-color-scheme: dark) {
+    body { background: #202124; color: #e8eaed; }
+    .tiles a { background: #303134; }
+    .tiles a:hover { background: #3c4043; }
+}
+"""
+
+
+def registerScheme():
+    """Registers broda://newtab/, which needs to happen before the
+    QApplication is created."""
+    scheme = QWebEngineUrlScheme(_scheme)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    # Local, so that web pages cannot load it
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme
+                    | QWebEngineUrlScheme.LocalScheme)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def newTabUrl():
+    return QUrl(f'{_scheme.decode()}://{_new_tab_host}/')
+
+
+def isNewTabUrl(url):
+    return url.scheme() == _scheme.decode() and url.host() == _new_tab_host
+
+
+def _origin(url_string):
+    scheme, separator, rest = url_string.partition('://')
+    return scheme + separator + rest.partition('/')[0]
+
+
+def _withoutScheme(url_string):
+    rest = url_string.partition('://')[2]
+    return rest[4:] if rest.startswith('www.') else rest
+
+
+def _logAddExp(a, b):
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def _logSumExp(values):
+    values = list(values)
+    top = max(values)
+    return top + math.log(sum(math.exp(v - top) for v in values))
+
+
+# The frecency of a URL is the sum of its visits weighted by
+# exp(-decay * age). Scores of different ages compare equally when
+# decayed to a common point in time, so each entry stores
+# log(score) + decay * time, which a visit updates by a log-sum-exp.
+# Visits only ever raise the rank of the visited URL, which allows
+# keeping the top entries up to date without scanning the table.
+# Likewise each origin keeps the summed rank of its URLs, and the origins
+# are kept sorted by their URL text without scheme and www., so that the
+# origins matching typed text are a range found by bisection.
+class FrecencyTable:
+    """Ranks URLs by their exponentially decaying visit counts."""
+
+    def __init__(self, entries=None, top_count=_top_site_count,
+                 max_entries=_max_entries):
+        self._entries = entries or {}  # map URL to [rank, title]
+        self._top_count = top_count
+        self._max_entries = max_entries
+        self._top = heapq.nlargest(top_count, self._entries,
+                                   key=self._rank)  # best first
+        self._origins = {}  # map origin to [rank, set of URLs]
+        for url, entry in self._entries.items():
+            self._addToOrigin(url, entry[0])
+        self._origin_keys = sorted((_withoutScheme(o).lower(), o)
+                                   for o in self._origins)
+
+    def _rank(self, url):
+        return self._entries[url][0]
+
+    def entries(self):
+        return self._entries
+
+    def visit(self, url, title, now=None, weight=1.0):
+        """Records a visit, returns whether the top entries changed."""
+        now = time.time() if now is None else now
+        rank = math.log(weight) + _decay * now
+        entry = self._entries.get(url)
+        if entry is None:
+            self._entries[url] = [rank, title]
+        else:
+            entry[0] = _logAddExp(entry[0], rank)
+            entry[1] = title or entry[1]
+        if self._addToOrigin(url, rank):
+            bisect.insort(self._origin_keys,
+                          (_withoutScheme(_origin(url)).lower(), _origin(url)))
+        changed = True
+        if url in self._top:
+            self._top.sort(key=self._rank, reverse=True)
+        elif len(self._top) < self._top_count:
+            self._top.append(url)
+            self._top.sort(key=self._rank, reverse=True)
+        elif self._rank(url) > self._rank(self._top[-1]):
+            self._top[-1] = url
+            self._top.sort(key=self._rank, reverse=True)
+        else:
+            changed = False
+        if len(self._entries) > self._max_entries:
+            self._prune(url)
+        return changed
+
+    # Returns whether the origin is new
+    def _addToOrigin(self, url, rank):
+        origin = self._origins.get(_origin(url))
+        if origin is None:
+            self._origins[_origin(url)] = [rank, {url}]
+            return True
+        origin[0] = _logAddExp(origin[0], rank)
+        origin[1].add(url)
+        return False
+
+    # Drop the lowest ranked tenth of the entries
+    def _prune(self, visited_url):
+        drop_count = max(1, self._max_entries // 10)
+        pruned_origins = set()
+        for url in heapq.nsmallest(drop_count, self._entries, key=self._rank):
+            if url != visited_url and url not in self._top:
+                del self._entries[url]
+                self._origins[_origin(url)][1].discard(url)
+                pruned_origins.add(_origin(url))
+        for origin in pruned_origins:
+            urls = self._origins[origin][1]
+            if urls:
+                self._origins[origin][0] = _logSumExp(self._rank(url)
+                                                      for url in urls)
+                continue
+            del self._origins[origin]
+            key = (_withoutScheme(origin).lower(), origin)
+            del self._origin_keys[bisect.bisect_left(self._origin_keys, key)]
+
+    # Text without a slash matches all URLs of the origins it is a prefix
+    # of, else only some URLs of the origins of the host it names
+    def _matchingOrigins(self, text):
+        host_text, slash, _ = text.partition('/')
+        keys = self._origin_keys
+        i = bisect.bisect_left(keys, (host_text,))
+        while i < len(keys) and keys[i][0].startswith(host_text):
+            key, origin = keys[i]
+            i += 1
+            rank, urls = self._origins[origin]
+            if not slash:
+                yield origin, rank
+                continue
+            if key != host_text:
+                break
+            ranks = [self._rank(url) for url in urls
+                     if _withoutScheme(url).lower().startswith(text)]
+            if ranks:
+                yield origin, _logSumExp(ranks)
+
+    def bestOrigin(self, text):
+        """Returns the origin of the URLs starting with the typed text
+        (ignoring the scheme and www.) if it clearly outranks the other
+        matching origins, else None."""
+        best = heapq.nlargest(2, self._matchingOrigins(text.lower()),
+                              key=lambda e: e[1])
+        if not best or (len(best) > 1
+                        and best[0][1] - best[1][1] < _confidence_margin):
+            return None
+        return best[0][0]
+
+    def topSites(self):
+        """Returns (URL, title) of the top entries, best first."""
+        return [(url, self._entries[url][1]) for url in self._top]
+
+
+class _IconLoadTaskSignals(QObject):
+    finished = QtCore.Signal(dict)
+
+
+# Reads favicon files on a pool thread, yielding a map of file name to
+# the base64 encoded content (empty if the file cannot be read)
+class _IconLoadTask(QRunnable):
+
+    def __init__(self, file_names, signals):
+        super().__init__()
+        self._file_names = file_names
+        self._signals = signals
+
+    def run(self):
+        icons = {}
+        for file_name in self._file_names:
+            try:
+                with open(file_name, 'rb') as f:
+                    icons[file_name] = base64.b64encode(f.read()).decode('ascii')
+            except OSError:
+                icons[file_name] = ''
+        self._signals.finished.emit(icons)
+
+
+# Serves broda://newtab/ with the top sites by frecency and the recent
+# bookmarks. The page is rendered ahead of time whenever its content
+# changes, requests are answered from the cached document. Favicons are
+# embedded once a pool thread has read their files, which renders the
+# page again; the files are named by content hash, so their data is kept
+# for as long as a tile shows them.
+class NewTabPage(QWebEngineUrlSchemeHandler):
+    """Provides the new tab page."""
+
+    _instance = None
+
+    @staticmethod
+    def instance():
+        if NewTabPage._instance is None:
+            NewTabPage._instance = NewTabPage(bookmarkwidget.configDir())
+        return NewTabPage._instance
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self._file_name = os.path.join(directory, _frecency_file)
+        self._table = FrecencyTable(self._readEntries())
+        self._recent_bookmarks = []
+        self._html = None
+        self._icons = {}  # map icon file name to base64 encoded data
+        self._loading_icons = set()
+        self._icon_signals = _IconLoadTaskSignals()
+        self._icon_signals.finished.connect(self._iconsLoaded)
+        self._render_timer = QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.setInterval(0)
+        self._render_timer.timeout.connect(self._render)
+        self._write_timer = QTimer(self)
+        self._write_timer.setSingleShot(True)
+        self._write_timer.setInterval(_write_delay)
+        self._write_timer.timeout.connect(self.flush)
+        self._modified = False
+        self._render_timer.start()
+
+    def install(self, profile):
+        profile.installUrlSchemeHandler(_scheme, self)
+
+    def _readEntries(self):
+        try:
+            with open(self._file_name) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f'Cannot read {self._file_name}: {e}')
+        return {}
+
+    def recordVisit(self, url, title):
+        if url.scheme() not in ('http', 'https'):
+            return
+        if self._table.visit(url.toString(), title):
+            self._render_timer.start()
+        self._modified = True
+        if not self._write_timer.isActive():
+            self._write_timer.start()
+
+    def bestOrigin(self, text):
+        return self._table.bestOrigin(text)
+
+    def setRecentBookmarks(self, bookmarks):
+        """Sets the bookmarks to show as a list of (QUrl, title)."""
+        recent_bookmarks = [(url.toString(), title) for url, title in bookmarks]
+        if recent_bookmarks != self._recent_bookmarks:
+            self._recent_bookmarks = recent_bookmarks
+            self._render_timer.start()
+
+    def flush(self):
+        """Writes the frecency table if it has changed."""
+        self._write_timer.stop()
+        if not self._modified:
+            return
+        self._modified = False
+        try:
+            os.makedirs(os.path.dirname(self._file_name), exist_ok=True)
+            with open(self._file_name + '.tmp', 'w') as f:
+                json.dump(self._table.entries(), f)
+            os.replace(self._file_name + '.tmp', self._file_name)
+        except OSError as e:
+            print(f'Cannot write {self._file_name}: {e}')
+
+    def _tiles(self, entries, icon_files):
+        store = FaviconStore.instance()
+        lines = ['<div class="tiles">']
+        for url_string, title in entries:
+            url = QUrl(url_string)
+            icon = ''
+            icon_file = store.iconFile(url, 16)
+            if icon_file:
+                icon_files.add(icon_file)
+                data = self._icons.get(icon_file)
+                if data:
+                    icon = f'<img src="data:image/png;base64,{data}" alt="">'
+            host = html.escape(url.host())
+            lines.append(f'<a href="{html.escape(url_string)}" '
+                         f'title="{html.escape(title)}">{icon}'
+                         f'{html.escape(title or url.host())}'
+                         f'<span class="host">{host}</span></a>')
+        lines.append('</div>')
+        return lines
+
+    def _render(self):
+        lines = ['<!DOCTYPE html><html><head><meta charset="utf-8">',
+                 f'<title>New Tab</title><style>{_style}</style></head><body>']
+        icon_files = set()
+        top_sites = self._table.topSites()
+        if top_sites:
+            lines.append('<h2>Most visited</h2>')
+            lines.extend(self._tiles(top_sites, icon_files))
+        if self._recent_bookmarks:
+            lines.append('<h2>Recent bookmarks</h2>')
+            lines.extend(self._tiles(self._recent_bookmarks, icon_files))
+        lines.append('</body></html>')
+        self._html = QByteArray('\n'.join(lines).encode('utf-8'))
+        self._icons = {f: d for f, d in self._icons.items() if f in icon_files}
+        missing = icon_files - self._icons.keys() - self._loading_icons
+        if missing:
+            self._loading_icons |= missing
+            QThreadPool.globalInstance().start(
+                _IconLoadTask(sorted(missing), self._icon_signals))
+
+    def _iconsLoaded(self, icons):
+        self._loading_icons -= icons.keys()
+        self._icons.update(icons)
+        if any(icons.values()):
+            self._render_timer.start()
+
+    def requestStarted(self, job):
+        if job.requestUrl().host() != _new_tab_host:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        if self._html is None or self._render_timer.isActive():
+            self._render_timer.stop()
+            self._render()
+        buffer = QBuffer(job)
+        buffer.setData(self._html)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(b'text/html', buffer)
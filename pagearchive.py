@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+from collections import deque
+
+from bookmarkwidget import configDir
+from PySide6 import QtCore
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QUrl
+from PySide6.QtNetwork import QNetworkInformation
+from PySide6.QtWebEngineCore import (QWebEngineDownloadRequest, QWebEnginePage,
+                                     QWebEngineProfile)
+
+_max_queued = 1000
+_max_in_flight = 2
+
+_boundary_pattern = re.compile(rb'boundary="?([^";\r\n]+)"?', re.IGNORECASE)
+
+
+def _urlKey(url):
+    without_fragment = url.toString().partition('#')[0]
+    return hashlib.sha1(without_fragment.encode('utf-8')).hexdigest()
+
+
+def _splitMhtml(data):
+    """Splits an MHTML document into its top level header, preamble,
+    boundary and parts, each a (header bytes, body bytes) tuple."""
+    header_end = data.find(b'\r\n\r\n')
+    match = _boundary_pattern.search(data, 0, header_end)
+    if header_end < 0 or match is None:
+        raise ValueError('Not a multipart MHTML document')
+    header = data[:header_end]
+    boundary = match.group(1)
+    delimiter = b'\r\n--' + boundary
+    parts = []
+    chunks = data[header_end:].split(delimiter)
+    preamble = chunks[0]
+    for chunk in chunks[1:]:
+        if chunk.startswith(b'--'):  # closing delimiter
+            break
+        part_header, _, body = chunk.partition(b'\r\n\r\n')
+        parts.append((part_header, body))
+    return header, preamble, boundary, parts
+
+
+def _writeFile(file_name, write):
+    """Writes file_name through write(f) into a temporary file that then
+    replaces it. The temporary file is unique, so that concurrent writers
+    of the same file do not collide."""
+    fd, temp_name = tempfile.mkstemp(suffix='.tmp',
+                                     dir=os.path.dirname(file_name))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+# Stores pages as a manifest per URL plus their MHTML parts, compressed
+# and addressed by the SHA-256 of their content, so that style sheets,
+# scripts and images shared by several pages are stored once.
+class ArchiveStore:
+    """Content addressed, compressed store of MHTML page archives."""
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._pages_directory = os.path.join(directory, 'pages')
+        self._objects_directory = os.path.join(directory, 'objects')
+        self._cache_directory = os.path.join(directory, 'cache')
+
+    def _manifestFile(self, url):
+        return os.path.join(self._pages_directory, _urlKey(url) + '.json')
+
+    def _objectFile(self, digest):
+        return os.path.join(self._objects_directory, digest[:2], digest[2:])
+
+    def contains(self, url):
+        return os.path.exists(self._manifestFile(url))
+
+    # Called on a pool thread
+    def add(self, url, title, mhtml):
+        header, preamble, boundary, parts = _splitMhtml(mhtml)
+        part_entries = []
+        for part_header, body in parts:
+            digest = hashlib.sha256(body).hexdigest()
+            object_file = self._objectFile(digest)
+            if not os.path.exists(object_file):
+                os.makedirs(os.path.dirname(object_file), exist_ok=True)
+                data = zlib.compress(body, 6)
+                try:
+                    _writeFile(object_file, lambda f: f.write(data))
+                except OSError:
+                    # Stored by a concurrent task, the content is the same
+                    if not os.path.exists(object_file):
+                        raise
+            part_entries.append({'header': part_header.decode('latin-1'),
+                                 'object': digest})
+        manifest = {'url': url.toString(), 'title': title, 'time': time.time(),
+                    'header': header.decode('latin-1'),
+                    'preamble': preamble.decode('latin-1'),
+                    'boundary': boundary.decode('latin-1'),
+                    'parts': part_entries}
+        os.makedirs(self._pages_directory, exist_ok=True)
+        data = json.dumps(manifest).encode('utf-8')
+        _writeFile(self._manifestFile(url), lambda f: f.write(data))
+        cache_file = os.path.join(self._cache_directory, _urlKey(url) + '.mhtml')
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+
+    # Called on a pool thread
+    def mhtmlFile(self, url):
+        """Returns the name of an MHTML file with the archived copy of url,
+        reassembled on first use, or None."""
+        manifest_file = self._manifestFile(url)
+        cache_file = os.path.join(self._cache_directory, _urlKey(url) + '.mhtml')
+        if os.path.exists(cache_file):
+            return cache_file
+        try:
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+            os.makedirs(self._cache_directory, exist_ok=True)
+            boundary = manifest['boundary'].encode('latin-1')
+
+            def write(out):
+                out.write(manifest['header'].encode('latin-1'))
+                out.write(manifest['preamble'].encode('latin-1'))
+                for part in manifest['parts']:
+                    with open(self._objectFile(part['object']), 'rb') as f:
+                        body = zlib.decompress(f.read())
+                    out.write(b'\r\n--' + boundary)
+                    out.write(part['header'].encode('latin-1') + b'\r\n\r\n')
+                    out.write(body)
+                out.write(b'\r\n--' + boundary + b'--\r\n')
+
+            _writeFile(cache_file, write)
+        except (OSError, ValueError, KeyError, zlib.error):
+            return None
+        return cache_file
+
+
+class _TaskSignals(QObject):
+    finished = QtCore.Signal(QUrl, str)
+    copy_ready = QtCore.Signal(int, QUrl)
+
+
+class _AddTask(QRunnable):
+
+    def __init__(self, store, url, title, file_name, signals):
+        super().__init__()
+        self._store = store
+        self._url = url
+        self._title = title
+        self._file_name = file_name
+        self._signals = signals
+
+    def run(self):
+        error = ''
+        try:
+            with open(self._file_name, 'rb') as f:
+                self._store.add(self._url, self._title, f.read())
+        except (OSError, ValueError) as e:
+            error = str(e)
+        finally:
+            if os.path.exists(self._file_name):
+                os.remove(self._file_name)
+        self._signals.finished.emit(self._url, error)
+
+
+class _CopyTask(QRunnable):
+
+    def __init__(self, store, url, request_id, signals):
+        super().__init__()
+        self._store = store
+        self._url = url
+        self._request_id = request_id
+        self._signals = signals
+
+    def run(self):
+        file_name = None
+        if self._store.contains(self._url):
+            file_name = self._store.mhtmlFile(self._url)
+        file_url = QUrl.fromLocalFile(file_name) if file_name else QUrl()
+        self._signals.copy_ready.emit(self._request_id, file_url)
+
+
+# Saves pages as MHTML through QWebEnginePage.save() and adds them to
+# the ArchiveStore on a pool thread. Bulk archiving loads the pages in
+# at most _max_in_flight hidden pages from a queue of bounded length.
+class PageArchiver(QObject):
+    """Archives pages for offline use."""
+
+    archived = QtCore.Signal(QUrl, bool)
+    progress = QtCore.Signal(int, int)
+
+    _instance = None
+
+    @staticmethod
+    def instance():
+        if PageArchiver._instance is None:
+            PageArchiver._instance = PageArchiver(os.path.join(configDir(), 'archive'))
+        return PageArchiver._instance
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self._store = ArchiveStore(directory)
+        self._temp_directory = os.path.join(directory, 'incoming')
+        self._saves = {}  # map MHTML file name to (url, title, page or None)
+        self._queue = deque()
+        self._idle_pages = []
+        self._busy_pages = set()
+        self._total = 0
+        self._done = 0
+        self._save_count = 0
+        self._copy_requests = {}  # map request id to callback
+        self._next_copy_request = 1
+        self._signals = _TaskSignals()
+        self._signals.finished.connect(self._added)
+        self._signals.copy_ready.connect(self._copyReady)
+        profile = QWebEngineProfile.defaultProfile()
+        profile.downloadRequested.connect(self._downloadRequested)
+
+    def store(self):
+        return self._store
+
+    def isArchiveDownload(self, download):
+        return download.isSavePageDownload() and download.downloadFileName() in self._saves
+
+    def requestArchivedCopy(self, url, callback):
+        """Calls callback with a file URL of the archived copy of url or an
+        invalid QUrl if there is none. The MHTML file is reassembled on a
+        pool thread."""
+        request_id = self._next_copy_request
+        self._next_copy_request += 1
+        self._copy_requests[request_id] = callback
+        QThreadPool.globalInstance().start(
+            _CopyTask(self._store, url, request_id, self._signals))
+
+    def _copyReady(self, request_id, file_url):
+        callback = self._copy_requests.pop(request_id, None)
+        if callback is not None:
+            callback(file_url)
+
+    def savePage(self, page, bulk_page=None):
+        os.makedirs(self._temp_directory, exist_ok=True)
+        self._save_count += 1
+        file_name = f'{os.getpid()}-{self._save_count}.mhtml'
+        self._saves[file_name] = (page.url(), page.title(), bulk_page)
+        page.save(os.path.join(self._temp_directory, file_name),
+                  QWebEngineDownloadRequest.MHTMLSaveFormat)
+
+    def _downloadRequested(self, download):
+        if self.isArchiveDownload(download):
+            download.isFinishedChanged.connect(self._saveFinished)
+
+    def _saveFinished(self):
+        download = self.sender()
+        if not download.isFinished():
+            return
+        url, title, bulk_page = self._saves.pop(download.downloadFileName())
+        file_name = os.path.join(download.downloadDirectory(),
+                                 download.downloadFileName())
+        if download.state() == QWebEngineDownloadRequest.DownloadCompleted:
+            QThreadPool.globalInstance().start(
+                _AddTask(self._store, url, title, file_name, self._signals))
+        else:
+            self.archived.emit(url, False)
+        if bulk_page is not None:
+            self._releasePage(bulk_page)
+
+    def _added(self, url, error):
+        if error:
+            print(f'Cannot archive {url.toString()}: {error}')
+        self.archived.emit(url, not error)
+
+    def archiveUrls(self, urls):
+        """Queues pages for archiving in the background. Returns the
+        number of URLs that did not fit into the queue."""
+        rejected = 0
+        for url in urls:
+            if len(self._queue) >= _max_queued:
+                rejected += 1
+            else:
+                self._queue.append(url)
+                self._total += 1
+        self._next()
+        return rejected
+
+    def _next(self):
+        while self._queue and len(self._busy_pages) < _max_in_flight:
+            page = self._idle_pages.pop() if self._idle_pages else self._createPage()
+            self._busy_pages.add(page)
+            page.load(self._queue.popleft())
+
+    def _createPage(self):
+        page = QWebEnginePage(QWebEngineProfile.defaultProfile(), self)
+        page.setAudioMuted(True)
+        page.loadFinished.connect(self._bulkLoadFinished)
+        return page
+
+    def _bulkLoadFinished(self, ok):
+        page = self.sender()
+        if page not in self._busy_pages:
+            return
+        if ok:
+            self.savePage(page, page)
+        else:
+            self.archived.emit(page.requestedUrl(), False)
+            self._releasePage(page)
+
+    def _releasePage(self, page):
+        self._busy_pages.discard(page)
+        self._done += 1
+        self.progress.emit(self._done, self._total)
+        if self._queue:
+            self._idle_pages.append(page)
+        else:
+            page.setUrl(QUrl('about:blank'))
+            page.deleteLater()
+            if not self._busy_pages:
+                self._idle_pages.clear()
+                self._done = self._total = 0
+        self._next()
+
+
+def isOffline():
+    """Returns whether the network is known to be unreachable."""
+    if QNetworkInformation.instance() is None:
+        QNetworkInformation.loadDefaultBackend()
+    information = QNetworkInformation.instance()
+    return (information is not None and information.reachability()
+            == QNetworkInformation.Reachability.Disconnected)
@@ -0,0 +1,280 @@
+import copy
+import json
+import os
+import queue
+import threading
+
+from PySide6.QtCore import QByteArray, QObject, QTimer
+
+_snapshot_file = 'session.json'
+_journal_file = 'session-journal.jsonl'
+
+# Delay for coalescing the changes of a window
+_flush_delay = 1000
+# Fold the journal into the snapshot once it is larger than the snapshot
+# and at least this large
+_min_compact_size = 4 * 1024 * 1024
+
+
+def _readJson(file_name):
+    try:
+        with open(file_name) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _tabIndex(tabs, tab_id):
+    for index, tab in enumerate(tabs):
+        if tab.get('id') == tab_id:
+            return index
+    raise KeyError(tab_id)
+
+
+# Tabs come with their history as QByteArray, which is base64 encoded on
+# the writer thread
+def _encodeHistories(record):
+    if 'state' in record:
+        tabs = record['state']['tabs']
+    else:
+        tabs = [record[key] for key in ('add', 'update') if key in record]
+    for tab in tabs:
+        history = tab.get('history')
+        if isinstance(history, QByteArray):
+            tab['history'] = bytes(history.toBase64()).decode('ascii')
+
+
+# Journal records carry either the full state of a window or a change of
+# one of its tabs (add/remove/move/update), each with the tab's history
+# only, optionally followed by the new current index
+def _apply(windows, record):
+    window_id = str(record['window'])
+    if record.get('closed'):
+        windows.pop(window_id, None)
+        return
+    if 'state' in record:
+        windows[window_id] = record['state']
+        return
+    state = windows[window_id]
+    tabs = state['tabs']
+    if 'add' in record:
+        tabs.insert(record['index'], record['add'])
+    elif 'remove' in record:
+        del tabs[_tabIndex(tabs, record['remove'])]
+    elif 'move' in record:
+        tab = tabs.pop(_tabIndex(tabs, record['move']))
+        tabs.insert(record['index'], tab)
+    elif 'update' in record:
+        tab = record['update']
+        tabs[_tabIndex(tabs, tab['id'])] = tab
+    if 'current' in record:
+        state['current'] = record['current']
+
+
+def readSession(directory):
+    """Returns the window states of the last session, {id: state}, from
+    the snapshot with the journal replayed on top. A record torn by a
+    crash ends the replay."""
+    windows = {}
+    snapshot = _readJson(os.path.join(directory, _snapshot_file))
+    if isinstance(snapshot, dict):
+        windows.update(snapshot.get('windows', {}))
+    try:
+        with open(os.path.join(directory, _journal_file)) as journal:
+            for line in journal:
+                try:
+                    _apply(windows, json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    break
+    except OSError:
+        pass
+    return windows
+
+
+# Appends journal records and compacts them into the snapshot, off the
+# GUI thread. It keeps the merged state in memory so that compaction
+# does not need to read anything back.
+class _JournalWriter(threading.Thread):
+
+    def __init__(self, directory, windows):
+        super().__init__(name='SessionJournalWriter', daemon=True)
+        self._directory = directory
+        self._windows = copy.deepcopy(windows)
+        self._queue = queue.Queue()
+        self._journal = None
+        self._journal_size = 0
+        self._snapshot_size = 0
+
+    def post(self, records):
+        self._queue.put(records)
+
+    def close(self):
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            self._compact()
+        except OSError as e:
+            print(f'Cannot write session to {self._directory}: {e}')
+            return
+        while True:
+            records = self._queue.get()
+            try:
+                if records is None:
+                    self._compact()
+                    self._journal.close()
+                    return
+                self._append(records)
+                if self._journal_size >= max(_min_compact_size,
+                                             self._snapshot_size):
+                    self._compact()
+            except OSError as e:
+                print(f'Cannot write session: {e}')
+
+    def _append(self, records):
+        for record in records:
+            _encodeHistories(record)
+            _apply(self._windows, record)
+            line = json.dumps(record, separators=(',', ':')) + '\n'
+            self._journal.write(line)
+            self._journal_size += len(line)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # Atomically replace the snapshot, then start an empty journal
+    def _compact(self):
+        snapshot_name = os.path.join(self._directory, _snapshot_file)
+        temp_name = snapshot_name + '.tmp'
+        with open(temp_name, 'w') as f:
+            json.dump({'windows': self._windows}, f)
+            f.flush()
+            os.fsync(f.fileno())
+            self._snapshot_size = f.tell()
+        os.replace(temp_name, snapshot_name)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(os.path.join(self._directory, _journal_file), 'w')
+        self._journal_size = 0
+
+
+# Persists the tabs of all main windows as they change. Windows report
+# changes through session_changed; once per _flush_delay the changed
+# tabs of the changed windows are collected and diffed against the tab
+# order last written, which yields one record per changed tab for the
+# writer thread. Only the first write of a window records all of its
+# tabs, unless it was restored with the same tab ids.
+class SessionStore(QObject):
+    """Crash-safe incremental session persistence."""
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self._directory = directory
+        self._restored = readSession(directory)
+        self._windows = {}  # map session id to MainWindow
+        self._layouts = {}  # map session id to (tab ids, current index)
+        self._dirty = set()
+        self._next_id = 1 + max((int(i) for i in self._restored), default=0)
+        self._writer = _JournalWriter(directory, self._restored)
+        self._writer.start()
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(_flush_delay)
+        self._flush_timer.timeout.connect(self.flush)
+
+    def restoredWindows(self):
+        """Returns (session id, state) of the windows of the last session."""
+        return sorted(((int(i), s) for i, s in self._restored.items()),
+                      key=lambda e: e[0])
+
+    def addWindow(self, window, session_id=None):
+        if session_id is None:
+            session_id = self._next_id
+            self._next_id += 1
+        self._windows[session_id] = window
+        restored_state = self._restored.get(str(session_id))
+        if restored_state is not None:
+            tab_ids = [tab.get('id') for tab in restored_state.get('tabs', [])]
+            if None not in tab_ids:
+                self._layouts[session_id] = (tab_ids,
+                                             restored_state.get('current', 0))
+        window.session_changed.connect(self._windowChanged)
+        self._markDirty(session_id)
+        return session_id
+
+    def removeWindow(self, window):
+        session_id = self._sessionId(window)
+        if session_id is not None:
+            del self._windows[session_id]
+            self._layouts.pop(session_id, None)
+            self._dirty.discard(session_id)
+            self._writer.post([{'window': session_id, 'closed': True}])
+
+    def _sessionId(self, window):
+        for session_id, w in self._windows.items():
+            if w is window:
+                return session_id
+        return None
+
+    def _windowChanged(self):
+        session_id = self._sessionId(self.sender())
+        if session_id is not None:
+            self._markDirty(session_id)
+
+    def _markDirty(self, session_id):
+        self._dirty.add(session_id)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush(self):
+        self._flush_timer.stop()
+        records = []
+        for session_id in sorted(self._dirty):
+            records.extend(self._windowRecords(session_id))
+        self._dirty.clear()
+        if records:
+            self._writer.post(records)
+
+    def _windowRecords(self, session_id):
+        layout = self._layouts.get(session_id)
+        tab_ids, current, changed = self._windows[session_id].sessionChanges(
+            all_tabs=layout is None)
+        self._layouts[session_id] = (tab_ids, current)
+        if layout is None:
+            state = {'tabs': [changed[i] for i in tab_ids], 'current': current}
+            return [{'window': session_id, 'state': state}]
+        old_tab_ids, old_current = layout
+        records = []
+        kept_ids = set(tab_ids)
+        order = []
+        for tab_id in old_tab_ids:
+            if tab_id in kept_ids:
+                order.append(tab_id)
+            else:
+                records.append({'window': session_id, 'remove': tab_id})
+        # Replaying the records in this order keeps order[:index] equal
+        # to tab_ids[:index]
+        old_ids = set(old_tab_ids)
+        for index, tab_id in enumerate(tab_ids):
+            if tab_id not in old_ids:
+                order.insert(index, tab_id)
+                records.append({'window': session_id, 'add': changed[tab_id],
+                                'index': index})
+                continue
+            if order[index] != tab_id:
+                order.remove(tab_id)
+                order.insert(index, tab_id)
+                records.append({'window': session_id, 'move': tab_id,
+                                'index': index})
+            if tab_id in changed:
+                records.append({'window': session_id,
+                                'update': changed[tab_id]})
+        if current != old_current:
+            records.append({'window': session_id, 'current': current})
+        return records
+
+    def close(self):
+        """Writes pending changes and compacts the journal."""
+        self.flush()
+        self._writer.close()
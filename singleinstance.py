@@ -0,0 +1,123 @@
+import getpass
+import json
+import os
+
+from PySide6 import QtCore
+from PySide6.QtCore import QByteArray, QDir, QLockFile, QObject
+from PySide6.QtNetwork import QLocalServer, QLocalSocket
+
+_connect_timeout = 200
+_write_timeout = 1000
+_lock_timeout = 5000
+# Attempts to forward or listen if the startup lock cannot be taken
+_start_attempts = 3
+
+
+def _serverName():
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'default'
+    return f'QtForPythonBrowser-{user}'
+
+
+# Ensures only one browser process runs per user. A second invocation
+# hands its URLs to the running instance over a QLocalSocket and exits
+# instead of starting its own Chromium processes.
+class SingleInstance(QObject):
+    """Forwards URLs to a running instance or listens for them."""
+
+    urls_received = QtCore.Signal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._server = None
+
+    # Send the URLs to a running instance. Returns False if there is none
+    # (or it does not respond), in which case this process should become
+    # the primary instance by calling listen().
+    def forward(self, urls):
+        socket = QLocalSocket()
+        socket.connectToServer(_serverName())
+        if not socket.waitForConnected(_connect_timeout):
+            return False
+        data = json.dumps(urls).encode('utf-8') + b'\n'
+        socket.write(QByteArray(data))
+        ok = socket.waitForBytesWritten(_write_timeout)
+        socket.disconnectFromServer()
+        return ok
+
+    def forwardOrListen(self, urls):
+        """Forwards urls to a running instance or becomes the primary
+        instance. Returns whether the URLs were forwarded. If neither
+        worked, isListening() is False."""
+        # QLocalServer.listen() with access options renames its socket
+        # into place, replacing one an instance started concurrently just
+        # created. Starting instances therefore take turns.
+        lock = QLockFile(os.path.join(QDir.tempPath(),
+                                      _serverName() + '.lock'))
+        locked = lock.tryLock(_lock_timeout)
+        try:
+            for attempt in range(_start_attempts):
+                if self.forward(urls):
+                    return True
+                if self.listen():
+                    return False
+            return False
+        finally:
+            if locked:
+                lock.unlock()
+
+    def isListening(self):
+        return self._server is not None and self._server.isListening()
+
+    # Become the primary instance. Returns False if that failed, for
+    # example because an instance started concurrently is listening now,
+    # in which case forward() should be tried again.
+    def listen(self):
+        if self._server is None:
+            self._server = QLocalServer(self)
+            self._server.setSocketOptions(QLocalServer.UserAccessOption)
+            self._server.newConnection.connect(self._newConnection)
+        name = _serverName()
+        if self._server.listen(name):
+            return True
+        # Only a socket nobody accepts on is left over from a crashed
+        # instance, a live one must not be removed
+        if not self._isStale(name):
+            return False
+        QLocalServer.removeServer(name)
+        if not self._server.listen(name):
+            error = self._server.errorString()
+            print(f'Cannot listen on "{name}": {error}')
+            return False
+        return True
+
+    @staticmethod
+    def _isStale(name):
+        socket = QLocalSocket()
+        socket.connectToServer(name)
+        if socket.waitForConnected(_connect_timeout):
+            socket.disconnectFromServer()
+            return False
+        return socket.error() == QLocalSocket.ConnectionRefusedError
+
+    def _newConnection(self):
+        while self._server.hasPendingConnections():
+            socket = self._server.nextPendingConnection()
+            socket.setParent(self)
+            socket.readyRead.connect(self._readyRead)
+            socket.disconnected.connect(socket.deleteLater)
+
+    def _readyRead(self):
+        socket = self.sender()
+        if not socket.canReadLine():
+            return
+        line = socket.readLine().data()
+        socket.disconnectFromServer()
+        try:
+            urls = json.loads(line)
+        except ValueError:
+            return
+        if isinstance(urls, list):
+            self.urls_received.emit([str(u) for u in urls])
@@ -0,0 +1,211 @@
+import html
+import time
+from collections import deque
+
+from newtabpage import NewTabPage
+from PySide6.QtCore import QCoreApplication, QEvent, QObject, QTimer, QUrl
+from PySide6.QtWebEngineCore import QWebEnginePage, QWebEngineProfile
+
+# At most this many hidden pages carry preconnects at a time
+_max_in_flight = 2
+# Preconnects waiting for a page, older ones are dropped
+_max_pending = 4
+# At most _rate_limit preconnects are started per _rate_window seconds
+_rate_limit = 8
+_rate_window = 10.0
+# Idle connections are kept open for about 10 s, so an origin is not
+# preconnected again within that time
+_origin_cooldown = 10.0
+# A navigation to a preconnected origin within this time counts as a hit
+_hit_window = 30.0
+# Time a page is kept after loading the hints, to let them complete
+_linger = 1000
+_typing_delay = 150
+_min_typed_length = 3
+
+_speculator = None
+
+
+def install():
+    """Enables speculative preconnects."""
+    global _speculator
+    if _speculator is None:
+        _speculator = Speculator()
+    return _speculator
+
+
+def uninstall():
+    global _speculator
+    if _speculator is not None:
+        _speculator.stop()
+        _speculator.deleteLater()
+        _speculator = None
+
+
+def hovered(url):
+    """Reports that a link to url is hovered, for example a bookmark."""
+    if _speculator is not None:
+        _speculator.hovered(url)
+
+
+def typed(text):
+    """Reports the text typed into the address bar."""
+    if _speculator is not None:
+        _speculator.typed(text)
+
+
+def navigated(url):
+    """Reports a navigation, to count speculation hits."""
+    if _speculator is not None:
+        _speculator.navigated(url)
+
+
+def statistics():
+    return _speculator.statistics() if _speculator is not None else None
+
+
+def _origin(url):
+    port = url.port()
+    origin = f'{url.scheme()}://{url.host().lower()}'
+    return origin + f':{port}' if port != -1 else origin
+
+
+# Warms up connections ahead of likely navigations: hovering a bookmark
+# or typing a prefix that clearly predicts an origin of the frecency
+# table preconnects to that origin. Nothing is requested from it. The
+# hints are <link rel="dns-prefetch"> and <link rel="preconnect">
+# elements in small documents loaded into hidden pages of the default
+# profile. A document has the target origin as its base URL rather than
+# about:blank, so that it belongs to the site of the navigation it
+# prepares instead of an opaque origin.
+class Speculator(QObject):
+    """Preconnects to likely navigation targets."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._idle_pages = []
+        self._busy_pages = set()
+        self._pending = deque()  # origins waiting for a page
+        self._started = deque()  # start times within the rate window
+        self._origin_times = {}  # map origin to last preconnect time
+        self._preconnected = {}  # map origin to time, until hit or expired
+        self._counts = {'preconnect': 0, 'hits': 0, 'misses': 0,
+                        'rate_limited': 0, 'cooldown': 0, 'dropped': 0}
+        self._typed_text = ''
+        self._typing_timer = QTimer(self)
+        self._typing_timer.setSingleShot(True)
+        self._typing_timer.setInterval(_typing_delay)
+        self._typing_timer.timeout.connect(self._predictTyped)
+
+    def hovered(self, url):
+        if url is not None and url.scheme() in ('http', 'https'):
+            self._request(_origin(url))
+
+    def typed(self, text):
+        self._typed_text = text.strip()
+        if len(self._typed_text) >= _min_typed_length:
+            self._typing_timer.start()
+        else:
+            self._typing_timer.stop()
+
+    def _predictTyped(self):
+        origin = NewTabPage.instance().bestOrigin(self._typed_text)
+        if origin:
+            self._request(_origin(QUrl(origin)))
+
+    # This counts navigations that could use a warm connection, whether
+    # it was still open is not known here
+    def navigated(self, url):
+        if url.scheme() not in ('http', 'https'):
+            return
+        self._expire()
+        if self._preconnected.pop(_origin(url), None) is not None:
+            self._counts['hits'] += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [origin for origin, started in self._preconnected.items()
+                   if now - started > _hit_window]
+        for origin in expired:
+            del self._preconnected[origin]
+        self._counts['misses'] += len(expired)
+
+    def _request(self, origin):
+        now = time.monotonic()
+        last = self._origin_times.get(origin)
+        if last is not None and now - last < _origin_cooldown:
+            self._counts['cooldown'] += 1
+            return
+        while self._started and now - self._started[0] > _rate_window:
+            self._started.popleft()
+        # Insertion order is the order of the times, oldest first
+        self._origin_times.pop(origin, None)
+        while self._origin_times:
+            old_origin, started = next(iter(self._origin_times.items()))
+            if now - started < _origin_cooldown:
+                break
+            del self._origin_times[old_origin]
+        if len(self._started) >= _rate_limit:
+            self._counts['rate_limited'] += 1
+            return
+        self._started.append(now)
+        self._origin_times[origin] = now
+        if len(self._pending) >= _max_pending:
+            self._origin_times.pop(self._pending.popleft(), None)
+            self._counts['dropped'] += 1
+        self._pending.append(origin)
+        self._next()
+
+    def _next(self):
+        while self._pending and len(self._busy_pages) < _max_in_flight:
+            origin = self._pending.pop()  # newest first
+            page = self._idle_pages.pop() if self._idle_pages else self._createPage()
+            self._busy_pages.add(page)
+            self._start(page, origin)
+
+    def _createPage(self):
+        page = QWebEnginePage(QWebEngineProfile.defaultProfile(), self)
+        page.setAudioMuted(True)
+        return page
+
+    def _start(self, page, origin):
+        self._counts['preconnect'] += 1
+        self._expire()
+        self._preconnected[origin] = time.monotonic()
+        href = html.escape(origin)
+        document = ('<!DOCTYPE html><html><head>'
+                    f'<link rel="dns-prefetch" href="{href}">'
+                    f'<link rel="preconnect" href="{href}">'
+                    '</head></html>')
+        page.setHtml(document, QUrl(origin + '/'))
+        QTimer.singleShot(_linger, self, lambda: self._release(page))
+
+    def _release(self, page):
+        if page not in self._busy_pages:
+            return  # stopped
+        self._busy_pages.discard(page)
+        self._idle_pages.append(page)
+        self._next()
+
+    def stop(self):
+        """Stops and deletes the hidden pages, which must not outlive the
+        profile, also when the event loop has already exited."""
+        self._typing_timer.stop()
+        self._pending.clear()
+        pages = self._idle_pages + list(self._busy_pages)
+        self._idle_pages = []
+        self._busy_pages.clear()
+        for page in pages:
+            page.triggerAction(QWebEnginePage.Stop)
+            page.deleteLater()
+            QCoreApplication.sendPostedEvents(page, QEvent.DeferredDelete)
+
+    def statistics(self):
+        """Returns the counters of preconnects and the rate of those
+        followed by a navigation to their origin."""
+        self._expire()
+        result = dict(self._counts)
+        result['outstanding'] = len(self._preconnected)
+        started = result['preconnect']
+        result['hit_rate'] = result['hits'] / started if started else 0.0
+        return result
@@ -0,0 +1,179 @@
+import functools
+import inspect
+import sys
+import threading
+import time
+import traceback
+
+from PySide6.QtCore import QObject, QTimer
+
+_heartbeat_interval = 0.05
+_default_threshold = 0.2
+_report_interval = 60.0
+
+# Upper bounds (ms) of the event loop latency histogram buckets
+_latency_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+_watchdog = None
+_slot_stack = []  # names of the timed slots running on the GUI thread
+
+
+def timedSlot(function):
+    """Decorates a signal handler so that its duration is recorded by the
+    watchdog, if installed, and so that stall reports name it. Surplus
+    signal arguments are dropped like PySide does for plain methods."""
+    parameters = list(inspect.signature(function).parameters.values())
+    if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+        argument_count = None
+    else:
+        argument_count = len([p for p in parameters
+                              if p.kind == p.POSITIONAL_OR_KEYWORD])
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if argument_count is not None:
+            args = args[:argument_count]
+        watchdog = _watchdog
+        if watchdog is None:
+            return function(*args, **kwargs)
+        _slot_stack.append(name)
+        start = time.monotonic()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _slot_stack.pop()
+            watchdog._recordSlot(name, time.monotonic() - start)
+    return wrapper
+
+
+def install(log_file_name, threshold=_default_threshold):
+    """Starts watching the event loop of the calling (GUI) thread once it
+    runs. Slots are timed right away."""
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = EventLoopWatchdog(log_file_name, threshold)
+        # No heartbeat is possible before the event loop runs, watching
+        # earlier would report the rest of startup as a stall
+        QTimer.singleShot(0, _watchdog, _watchdog.start)
+    return _watchdog
+
+
+def uninstall():
+    global _watchdog
+    if _watchdog is not None:
+        _watchdog.stop()
+        _watchdog = None
+
+
+# A heartbeat timer on the GUI thread records when the event loop last
+# ran; a watchdog thread reports a stall with the GUI thread's Python
+# stack once the heartbeat is late by more than the threshold. All file
+# output happens on the watchdog thread.
+class EventLoopWatchdog(QObject):
+    """Measures event loop latency and reports GUI thread stalls."""
+
+    def __init__(self, log_file_name, threshold=_default_threshold,
+                 parent=None):
+        super().__init__(parent)
+        self._log_file_name = log_file_name
+        self._threshold = threshold
+        self._gui_thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+        self._histogram = [0] * (len(_latency_buckets) + 1)
+        self._slot_statistics = {}  # map name to [count, total, max]
+        self._slow_slots = []
+        self._last_beat = time.monotonic()
+        self._stall_reported = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='EventLoopWatchdog')
+        self._timer = QTimer(self)
+        self._timer.setInterval(int(_heartbeat_interval * 1000))
+        self._timer.timeout.connect(self._beat)
+
+    def start(self):
+        if self._stop_event.is_set() or self._thread.is_alive():
+            return
+        self._last_beat = time.monotonic()
+        self._timer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _beat(self):
+        now = time.monotonic()
+        latency_ms = (now - self._last_beat - _heartbeat_interval) * 1000
+        bucket = 0
+        while bucket < len(_latency_buckets) and latency_ms > _latency_buckets[bucket]:
+            bucket += 1
+        with self._lock:
+            self._histogram[bucket] += 1
+        self._last_beat = now
+        self._stall_reported = False
+
+    def _recordSlot(self, name, duration):
+        with self._lock:
+            statistics = self._slot_statistics.setdefault(name, [0, 0.0, 0.0])
+            statistics[0] += 1
+            statistics[1] += duration
+            statistics[2] = max(statistics[2], duration)
+            if duration > self._threshold:
+                self._slow_slots.append((name, duration))
+
+    def _run(self):
+        next_report = time.monotonic() + _report_interval
+        with open(self._log_file_name, 'a') as log:
+            while not self._stop_event.wait(_heartbeat_interval):
+                stall = time.monotonic() - self._last_beat
+                if stall > self._threshold and not self._stall_reported:
+                    self._stall_reported = True
+                    self._writeStall(log, stall)
+                with self._lock:
+                    slow_slots = self._slow_slots
+                    self._slow_slots = []
+                for name, duration in slow_slots:
+                    log.write(f'{_timestamp()} slow slot {name}: '
+                              f'{duration * 1000:.0f} ms\n')
+                if time.monotonic() >= next_report:
+                    next_report += _report_interval
+                    self._writeStatistics(log)
+                log.flush()
+            self._writeStatistics(log)
+
+    def _writeStall(self, log, stall):
+        frame = sys._current_frames().get(self._gui_thread_id)
+        slots = ' > '.join(_slot_stack) or '(none)'
+        log.write(f'{_timestamp()} event loop stalled for more than '
+                  f'{stall * 1000:.0f} ms, in slots: {slots}\n')
+        if frame is not None:
+            log.writelines('    ' + line for line in
+                           ''.join(traceback.format_stack(frame)).splitlines(True))
+
+    def _writeStatistics(self, log):
+        with self._lock:
+            histogram = list(self._histogram)
+            slot_statistics = {name: list(s) for name, s
+                               in self._slot_statistics.items()}
+        log.write(f'{_timestamp()} event loop latency histogram:\n')
+        lower = 0
+        for upper, count in zip(_latency_buckets + [None], histogram):
+            label = f'{lower}-{upper} ms' if upper else f'>{lower} ms'
+            log.write(f'    {label:>14} {count}\n')
+            lower = upper
+        if slot_statistics:
+            log.write('    slot                                 calls   '
+                      'total ms     max ms\n')
+            by_total = sorted(slot_statistics.items(),
+                              key=lambda e: e[1][1], reverse=True)
+            for name, (count, total, maximum) in by_total:
+                log.write(f'    {name:36} {count:6} {total * 1000:10.1f} '
+                          f'{maximum * 1000:10.1f}\n')
+
+
+def _timestamp():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,40 @@
+import sys
+import time
+
+# Monotonic timestamps of the startup phases. Recording is cheap enough
+# to always be on, the trace is only printed when requested.
+_start = time.monotonic()
+_marks = []
+
+
+def mark(phase):
+    """Records the time at which a startup phase was reached."""
+    _marks.append((phase, time.monotonic()))
+
+
+def elapsed(phase=None):
+    """Returns the seconds from process start to the first occurrence of
+    phase, to the last recorded phase if phase is None, or None if the
+    phase has not been reached yet."""
+    if phase is None:
+        return _marks[-1][1] - _start if _marks else 0.0
+    for name, timestamp in _marks:
+        if name == phase:
+            return timestamp - _start
+    return None
+
+
+def phases():
+    """Returns (phase, seconds since process start) of the recorded
+    phases in order."""
+    return [(name, timestamp - _start) for name, timestamp in _marks]
+
+
+def dump(file=sys.stderr):
+    previous = _start
+    print('Startup trace (ms since start, delta):', file=file)
+    for name, timestamp in _marks:
+        total_ms = (timestamp - _start) * 1000
+        delta_ms = (timestamp - previous) * 1000
+        print(f'{total_ms:9.1f} {delta_ms:+8.1f}  {name}', file=file)
+        previous = timestamp
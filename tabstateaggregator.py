@@ -0,0 +1,53 @@
+from PySide6.QtCore import QObject, QTimer
+
+# Dirty flags of a tab
+ACTIONS = 0x1
+URL = 0x2
+TITLE = 0x4
+ICON = 0x8
+
+
+# Collects state changes of the tabs of a window as dirty flags and
+# applies them once per event loop iteration, so that a burst of
+# signals from a busy page results in a single UI update.
+class TabStateAggregator(QObject):
+    """Coalesces tab state changes into one flush per event loop frame."""
+
+    def __init__(self, flush_function, parent=None):
+        super().__init__(parent)
+        self._flush_function = flush_function
+        self._dirty = {}  # map WebEngineView to dirty flags
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.flush)
+        self._change_count = 0
+        self._coalesced_count = 0
+        self._flush_count = 0
+
+    def markDirty(self, web_engine_view, flags):
+        self._change_count += 1
+        pending = self._dirty.get(web_engine_view, 0)
+        if pending & flags == flags:
+            self._coalesced_count += 1
+        self._dirty[web_engine_view] = pending | flags
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def discard(self, web_engine_view):
+        self._dirty.pop(web_engine_view, None)
+
+    def flush(self):
+        self._timer.stop()
+        dirty = self._dirty
+        self._dirty = {}
+        if dirty:
+            self._flush_count += 1
+            self._flush_function(dirty)
+
+    def statistics(self):
+        """Returns the number of changes reported, of those that were
+        already pending (coalesced) and of flushes."""
+        return {'changes': self._change_count,
+                'coalesced': self._coalesced_count,
+                'flushes': self._flush_count}
@@ -0,0 +1,74 @@
+from tabthumbnailcache import TabThumbnailCache
+from PySide6.QtCore import QSize, Qt
+from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import (QDialog, QLineEdit, QListView, QListWidget,
+                               QListWidgetItem, QVBoxLayout)
+
+_icon_size = QSize(240, 150)
+
+
+# A grid of the tabs of a BrowserTabWidget showing their cached
+# thumbnails. Tabs without a thumbnail show their icon; no tab is
+# rendered or loaded to draw the grid.
+class TabSwitcher(QDialog):
+    """Lets you pick a tab from an overview, filtered by title or URL."""
+
+    def __init__(self, tab_widget, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Tabs')
+        self._tab_widget = tab_widget
+
+        self._filter_line_edit = QLineEdit()
+        self._filter_line_edit.setClearButtonEnabled(True)
+        self._filter_line_edit.setPlaceholderText("Filter...")
+        self._filter_line_edit.textChanged.connect(self._filter)
+        self._filter_line_edit.returnPressed.connect(self._activateFirst)
+
+        self._list_widget = QListWidget()
+        self._list_widget.setViewMode(QListView.IconMode)
+        self._list_widget.setResizeMode(QListView.Adjust)
+        self._list_widget.setMovement(QListView.Static)
+        self._list_widget.setUniformItemSizes(True)
+        self._list_widget.setIconSize(_icon_size)
+        self._list_widget.setWordWrap(True)
+        self._list_widget.itemActivated.connect(self._activated)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self._filter_line_edit)
+        layout.addWidget(self._list_widget)
+        self._populate()
+
+    def _populate(self):
+        cache = TabThumbnailCache.instance()
+        current_index = self._tab_widget.currentIndex()
+        for index in range(self._tab_widget.count()):
+            view = self._tab_widget.widget(index)
+            item = QListWidgetItem(self._tab_widget.tabText(index))
+            data = cache.thumbnail(view)
+            pixmap = QPixmap()
+            if data is not None and pixmap.loadFromData(data):
+                item.setIcon(pixmap)
+            else:
+                item.setIcon(self._tab_widget.tabIcon(index))
+            item.setToolTip(f'{view.title()}\n{view.url().toString()}')
+            item.setData(Qt.UserRole, index)
+            self._list_widget.addItem(item)
+            if index == current_index:
+                self._list_widget.setCurrentItem(item)
+
+    def _filter(self, text):
+        needle = text.strip().lower()
+        for row in range(self._list_widget.count()):
+            item = self._list_widget.item(row)
+            item.setHidden(bool(needle) and needle not in item.toolTip().lower())
+
+    def _activateFirst(self):
+        for row in range(self._list_widget.count()):
+            item = self._list_widget.item(row)
+            if not item.isHidden():
+                self._activated(item)
+                return
+
+    def _activated(self, item):
+        self._tab_widget.setCurrentIndex(item.data(Qt.UserRole))
+        self.accept()
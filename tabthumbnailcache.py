@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from functools import partial
+
+from PySide6 import QtCore
+from PySide6.QtCore import (QBuffer, QByteArray, QIODevice, QObject,
+                            QRunnable, QSize, Qt, QThreadPool)
+
+_thumbnail_size = QSize(320, 200)
+_thumbnail_format = 'JPG'
+_thumbnail_quality = 75
+_default_byte_budget = 16 * 1024 * 1024
+
+
+class _ScaleTaskSignals(QObject):
+    finished = QtCore.Signal(object, int, QByteArray)
+
+
+# Downscales and compresses a grabbed QImage on a pool thread
+# (unlike QPixmap, QImage may be used outside the GUI thread).
+class _ScaleTask(QRunnable):
+
+    def __init__(self, key, generation, image, signals):
+        super().__init__()
+        self._key = key
+        self._generation = generation
+        self._image = image
+        self._signals = signals
+
+    def run(self):
+        scaled = self._image.scaled(_thumbnail_size, Qt.KeepAspectRatio,
+                                    Qt.SmoothTransformation)
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        scaled.save(buffer, _thumbnail_format, _thumbnail_quality)
+        self._signals.finished.emit(self._key, self._generation,
+                                    buffer.data())
+
+
+# Compressed thumbnails of the tabs of all windows, evicted least
+# recently used first once their total size exceeds the byte budget.
+class TabThumbnailCache(QObject):
+    """Stores tab thumbnails for the tab switcher."""
+
+    _instance = None
+
+    @staticmethod
+    def instance():
+        if TabThumbnailCache._instance is None:
+            TabThumbnailCache._instance = TabThumbnailCache()
+        return TabThumbnailCache._instance
+
+    def __init__(self, byte_budget=_default_byte_budget, parent=None):
+        super().__init__(parent)
+        self._byte_budget = byte_budget
+        self._byte_count = 0
+        self._thumbnails = OrderedDict()  # map WebEngineView to QByteArray
+        self._generations = {}  # map WebEngineView to latest capture
+        self._signals = _ScaleTaskSignals()
+        self._signals.finished.connect(self._scaled)
+
+    # Only tabs that are on screen are grabbed, their last frame is still
+    # current. Hidden tabs are never asked to render.
+    def capture(self, web_engine_view):
+        if not web_engine_view.isVisible():
+            return
+        image = web_engine_view.grab().toImage()
+        if image.isNull():
+            return
+        if web_engine_view not in self._generations:
+            # Views of closed windows are deleted without remove()
+            web_engine_view.destroyed.connect(partial(self.remove,
+                                                      web_engine_view))
+        generation = self._generations.get(web_engine_view, 0) + 1
+        self._generations[web_engine_view] = generation
+        task = _ScaleTask(web_engine_view, generation, image, self._signals)
+        QThreadPool.globalInstance().start(task)
+
+    def _scaled(self, web_engine_view, generation, data):
+        # Drop results of superseded captures and of removed tabs
+        if self._generations.get(web_engine_view) != generation:
+            return
+        self._take(web_engine_view)
+        self._thumbnails[web_engine_view] = data
+        self._byte_count += data.size()
+        while self._byte_count > self._byte_budget and self._thumbnails:
+            _, evicted = self._thumbnails.popitem(last=False)
+            self._byte_count -= evicted.size()
+
+    def _take(self, web_engine_view):
+        data = self._thumbnails.pop(web_engine_view, None)
+        if data is not None:
+            self._byte_count -= data.size()
+        return data
+
+    def thumbnail(self, web_engine_view):
+        """Returns the compressed thumbnail of a tab or None, marking
+        it as recently used."""
+        data = self._thumbnails.get(web_engine_view)
+        if data is not None:
+            self._thumbnails.move_to_end(web_engine_view)
+        return data
+
+    def remove(self, web_engine_view):
+        self._take(web_engine_view)
+        self._generations.pop(web_engine_view, None)
+
+    def byteCount(self):
+        return self._byte_count
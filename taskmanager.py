@@ -0,0 +1,183 @@
+import os
+import signal
+import time
+
+from PySide6.QtCore import QItemSelectionModel, Qt, QTimer
+from PySide6.QtWidgets import (QAbstractItemView, QHBoxLayout, QHeaderView,
+                               QPushButton, QTableWidget, QTableWidgetItem,
+                               QVBoxLayout, QWidget)
+
+_sample_interval = 1000
+
+try:
+    _clock_ticks = os.sysconf('SC_CLK_TCK')
+    _page_size = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _clock_ticks = 100
+    _page_size = 4096
+
+_TABS_COLUMN = 0
+_PID_COLUMN = 1
+_CPU_COLUMN = 2
+_MEMORY_COLUMN = 3
+_GROWTH_COLUMN = 4
+
+
+def _readProcStat(pid):
+    """Returns (cpu ticks, rss bytes) of a process from /proc/<pid>/stat
+    or None if it cannot be read (not Linux, process gone). The resident
+    set size is taken from the same read instead of /proc/<pid>/status."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, fields follow the last ')'
+    fields = stat[stat.rfind(b')') + 2:].split()
+    try:
+        cpu_ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        rss_bytes = int(fields[21]) * _page_size
+    except (IndexError, ValueError):
+        return None
+    return cpu_ticks, rss_bytes
+
+
+class _NumberItem(QTableWidgetItem):
+    """Displays a formatted number but sorts by its value."""
+
+    def __init__(self, value, text):
+        super().__init__(text)
+        self._value = value
+        self.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+
+    def __lt__(self, other):
+        return self._value < getattr(other, '_value', 0)
+
+
+# Lists the renderer processes of the tabs of all windows. A single
+# timer samples every renderer once per tick, tabs sharing a renderer
+# share a row.
+class TaskManagerWindow(QWidget):
+    """Shows CPU and memory usage per renderer process."""
+
+    def __init__(self, tab_widgets_function, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Task Manager')
+        self.setAttribute(Qt.WA_QuitOnClose, False)
+        self._tab_widgets_function = tab_widgets_function
+        self._previous_samples = {}  # map pid to (time, cpu ticks, rss)
+        self._views = {}  # map pid to list of WebEngineView
+
+        self._table = QTableWidget(0, 5)
+        self._table.setHorizontalHeaderLabels(['Tabs', 'PID', 'CPU %',
+                                               'Memory', 'Growth'])
+        self._table.verticalHeader().hide()
+        self._table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self._table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self._table.setSortingEnabled(True)
+        self._table.sortByColumn(_CPU_COLUMN, Qt.DescendingOrder)
+        header = self._table.horizontalHeader()
+        header.setSectionResizeMode(_TABS_COLUMN, QHeaderView.Stretch)
+
+        reload_button = QPushButton('Reload')
+        reload_button.clicked.connect(self._reloadSelected)
+        end_process_button = QPushButton('End Process')
+        end_process_button.clicked.connect(self._endSelected)
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        button_layout.addWidget(reload_button)
+        button_layout.addWidget(end_process_button)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self._table)
+        layout.addLayout(button_layout)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(_sample_interval)
+        self._timer.timeout.connect(self._sample)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._sample()
+        self._timer.start()
+
+    def hideEvent(self, event):
+        self._timer.stop()
+        super().hideEvent(event)
+
+    def _collectViews(self):
+        views = {}
+        for tab_widget in self._tab_widgets_function():
+            for view in tab_widget.loadedViews():
+                pid = view.page().renderProcessPid()
+                if pid > 0:
+                    views.setdefault(pid, []).append(view)
+        return views
+
+    def _sample(self):
+        self._views = self._collectViews()
+        now = time.monotonic()
+        samples = {}
+        rows = []
+        for pid, views in self._views.items():
+            stat = _readProcStat(pid)
+            if stat is None:
+                rows.append((pid, views, None, None, None))
+                continue
+            cpu_ticks, rss = stat
+            samples[pid] = (now, cpu_ticks, rss)
+            cpu = growth = None
+            previous = self._previous_samples.get(pid)
+            if previous is not None and now > previous[0]:
+                elapsed = now - previous[0]
+                cpu = 100 * (cpu_ticks - previous[1]) / _clock_ticks / elapsed
+                growth = (rss - previous[2]) / elapsed
+            rows.append((pid, views, cpu, rss, growth))
+        self._previous_samples = samples
+        self._updateTable(rows)
+
+    def _updateTable(self, rows):
+        selected_pids = set(self._selectedPids())
+        self._table.setSortingEnabled(False)
+        self._table.setRowCount(len(rows))
+        for row, (pid, views, cpu, rss, growth) in enumerate(rows):
+            titles = ', '.join(v.title() or v.url().toString() for v in views)
+            tabs_item = QTableWidgetItem(titles)
+            tabs_item.setToolTip('\n'.join(v.url().toString() for v in views))
+            self._table.setItem(row, _TABS_COLUMN, tabs_item)
+            self._table.setItem(row, _PID_COLUMN, _NumberItem(pid, str(pid)))
+            self._table.setItem(row, _CPU_COLUMN, _NumberItem(
+                cpu or 0, '-' if cpu is None else f'{cpu:.1f}'))
+            self._table.setItem(row, _MEMORY_COLUMN, _NumberItem(
+                rss or 0, '-' if rss is None else f'{rss / 1048576:.1f} MB'))
+            self._table.setItem(row, _GROWTH_COLUMN, _NumberItem(
+                growth or 0,
+                '-' if growth is None else f'{growth / 1024:+.1f} KB/s'))
+        self._table.setSortingEnabled(True)
+        self._table.clearSelection()
+        selection_model = self._table.selectionModel()
+        for row in range(self._table.rowCount()):
+            if self._pidOfRow(row) in selected_pids:
+                selection_model.select(self._table.model().index(row, 0),
+                                       QItemSelectionModel.Select
+                                       | QItemSelectionModel.Rows)
+
+    def _pidOfRow(self, row):
+        return int(self._table.item(row, _PID_COLUMN).text())
+
+    def _selectedPids(self):
+        rows = {index.row() for index in self._table.selectedIndexes()}
+        return [self._pidOfRow(row) for row in rows]
+
+    def _reloadSelected(self):
+        for pid in self._selectedPids():
+            for view in self._views.get(pid, []):
+                view.reload()
+
+    def _endSelected(self):
+        for pid in self._selectedPids():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                print(f'Cannot end process {pid}: {e}')
+        self._sample()
@@ -2,6 +2,7 @@ from PySide6.QtWebEngineCore import QWebEnginePage
 from PySide6.QtWebEngineWidgets import QWebEngineView
 
 from PySide6 import QtCore
+from PySide6.QtCore import QByteArray, QDataStream, QIODevice
 
 _web_actions = [QWebEnginePage.Back, QWebEnginePage.Forward,
                 QWebEnginePage.Reload,
@@ -36,6 +37,64 @@ class WebEngineView(QWebEngineView):
             action = page.action(web_action)
             action.changed.connect(self._enabledChanged)
             self._actions[action] = web_action
+        self._loading = False
+        self._last_load_ok = False
+        self.loadStarted.connect(self._loadStarted)
+        self.loadFinished.connect(self._loadFinished)
+        self._history_data = None
+        self.urlChanged.connect(self._invalidateHistoryData)
+        self.titleChanged.connect(self._invalidateHistoryData)
+
+    # Mark the view as loading right away, loadStarted is only emitted
+    # once the navigation has actually begun. Navigations started by the
+    # page are tracked from loadStarted.
+    def setUrl(self, url):
+        self._loading = True
+        super().setUrl(url)
+
+    def load(self, request):
+        self._loading = True
+        super().load(request)
+
+    def isLoading(self):
+        return self._loading
+
+    def lastLoadSucceeded(self):
+        return self._last_load_ok
+
+    def _loadStarted(self):
+        self._loading = True
+
+    def _loadFinished(self, ok):
+        self._loading = False
+        self._last_load_ok = ok
+        self._invalidateHistoryData()
+
+    def _invalidateHistoryData(self):
+        self._history_data = None
+
+    def historyData(self):
+        """Returns the navigation history serialized through QDataStream,
+        cached until the page changes."""
+        if self._history_data is None:
+            data = QByteArray()
+            stream = QDataStream(data, QIODevice.WriteOnly)
+            stream << self.page().history()
+            self._history_data = data
+        return self._history_data
+
+    def setHistoryData(self, data):
+        """Restores a history obtained from historyData(), which navigates
+        to its current entry."""
+        history = self.page().history()
+        # The stream does not keep its buffer alive
+        buffer = QByteArray(data)
+        stream = QDataStream(buffer, QIODevice.ReadOnly)
+        stream >> history
+        self._loading = history.count() > 0
+
+    def setTabFactoryFunction(self, tab_factory_func):
+        self._tab_factory_func = tab_factory_func
 
     def isWebActionEnabled(self, web_action):
         return self.page().action(web_action).isEnabled()